@@ -0,0 +1,298 @@
+import glob
+import json
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+CALIBRATION_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class Boxes:
+    def __init__(self, data):
+        self.data = data  # (N, 6) x1, y1, x2, y2, confidence, class_id
+
+    def __len__(self):
+        return len(self.data)
+
+
+class Result:
+    """The part of an ultralytics Results object YOLODetector reads"""
+
+    def __init__(self, data, names):
+        self.boxes = Boxes(data)
+        self.names = names
+
+    def __len__(self):
+        return len(self.boxes)
+
+
+def letterbox(frame, imgsz=640, stride=32, auto=False):
+    """
+    Resize keeping the aspect ratio and pad with grey, exactly like ultralytics.
+
+    With auto True the padding only reaches the next multiple of stride
+    (what the PyTorch backend does for a single image), otherwise the result
+    is imgsz x imgsz. Returns the padded BGR image, the scale and the
+    (left, top) padding.
+    """
+    height, width = frame.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    pad_width, pad_height = imgsz - new_width, imgsz - new_height
+    if auto:
+        pad_width, pad_height = pad_width % stride, pad_height % stride
+    pad_width /= 2
+    pad_height /= 2
+    if (width, height) != (new_width, new_height):
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_height - 0.1)), int(round(pad_height + 0.1))
+    left, right = int(round(pad_width - 0.1)), int(round(pad_width + 0.1))
+    padded = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return padded, scale, (left, top)
+
+
+def to_tensor(images):
+    """BGR HWC uint8 images of one size -> RGB NCHW float32 batch in [0, 1]"""
+    batch = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+def postprocess(prediction, conf, iou, scale, pad, shape, max_det=300):
+    """
+    One image's raw YOLOv8 output (4 + classes, anchors) -> (N, 6) detections.
+
+    Mirrors ultralytics non_max_suppression: best class per anchor, confidence
+    filter, class-aware NMS (boxes offset per class), then boxes mapped back
+    from the letterboxed input to the original frame.
+    """
+    prediction = prediction.T
+    scores = prediction[:, 4:]
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+    keep = confidences > conf
+    if not keep.any():
+        return np.zeros((0, 6), dtype=np.float32)
+    xywh, confidences, class_ids = prediction[keep, :4], confidences[keep], class_ids[keep]
+
+    # Offsetting boxes by class keeps NMS from suppressing across classes
+    corners = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, 2:]], axis=1)  # x, y, w, h
+    corners[:, :2] += class_ids[:, None] * 7680.0
+    indices = cv2.dnn.NMSBoxes(corners.tolist(), confidences.tolist(), conf, iou)
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1)[:max_det]
+
+    boxes = np.concatenate([xywh[indices, :2] - xywh[indices, 2:] / 2,
+                            xywh[indices, :2] + xywh[indices, 2:] / 2], axis=1)
+    boxes -= np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)
+    boxes /= scale
+    height, width = shape[:2]
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    return np.column_stack([boxes, confidences[indices], class_ids[indices]]).astype(np.float32)
+
+
+class ExportedModel:
+    """
+    Runs an exported YOLOv8 model and is called like an ultralytics YOLO model.
+
+    model(frame_or_list, conf=...) returns one Result per frame, so
+    YOLODetector uses it exactly like the PyTorch model. Subclasses only
+    implement _run(batch) -> raw (B, 4 + classes, anchors) output.
+    """
+
+    def __init__(self, names, imgsz=640, dynamic_batch=True, dynamic_shape=True):
+        self.names = names
+        self.imgsz = imgsz
+        self.dynamic_batch = dynamic_batch
+        self.dynamic_shape = dynamic_shape
+
+    def __call__(self, source, conf=0.25, iou=0.7, max_det=300, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        # Single images get the minimal stride padding PyTorch uses, batches a common size
+        auto = self.dynamic_shape and len(frames) == 1
+        letterboxed = [letterbox(frame, self.imgsz, auto=auto) for frame in frames]
+        images = [image for image, _, _ in letterboxed]
+        if self.dynamic_batch:
+            outputs = self._run(to_tensor(images))
+        else:
+            outputs = np.concatenate([self._run(to_tensor([image])) for image in images])
+        return [Result(postprocess(output, conf, iou, scale, pad, frame.shape, max_det), self.names)
+                for output, frame, (_, scale, pad) in zip(outputs, frames, letterboxed)]
+
+    def _run(self, batch):
+        raise NotImplementedError
+
+
+class OnnxModel(ExportedModel):
+    def __init__(self, path, names, imgsz=640, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        shape = self.session.get_inputs()[0].shape
+        super().__init__(names, imgsz, dynamic_batch=not isinstance(shape[0], int),
+                         dynamic_shape=not isinstance(shape[2], int))
+
+    def _run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoModel(ExportedModel):
+    def __init__(self, path, names, imgsz=640, threads=None):
+        import openvino as ov
+
+        core = ov.Core()
+        model = core.read_model(path)
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.compiled = core.compile_model(model, "CPU", config)
+        self.output = self.compiled.output(0)
+        shape = model.inputs[0].get_partial_shape()
+        super().__init__(names, imgsz, dynamic_batch=shape[0].is_dynamic, dynamic_shape=shape[2].is_dynamic)
+
+    def _run(self, batch):
+        return self.compiled(batch)[self.output]
+
+
+def calibration_images(calibration_dir, imgsz=640, limit=300):
+    """Letterboxed calibration batches of one image each, for INT8 quantization"""
+    paths = sorted(path for path in glob.glob(os.path.join(calibration_dir, "*"))
+                   if path.lower().endswith(CALIBRATION_EXTENSIONS))[:limit]
+    if not paths:
+        raise FileNotFoundError(f"No calibration images in {calibration_dir}")
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is not None:
+            yield to_tensor([letterbox(frame, imgsz)[0]])
+
+
+def _quantize_onnx(source_path, output_path, calibration_dir, imgsz):
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    import onnxruntime as ort
+
+    input_name = ort.InferenceSession(source_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = calibration_images(calibration_dir, imgsz)
+
+        def get_next(self):
+            batch = next(self.batches, None)
+            return None if batch is None else {input_name: batch}
+
+    # Only convolutions are quantized: the head concatenates pixel boxes with 0-1 scores,
+    # and one uint8 scale for both would round every score to zero
+    quantize_static(source_path, output_path, Reader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True,
+                    op_types_to_quantize=["Conv", "MatMul"])
+
+
+def _quantize_openvino(source_path, output_path, calibration_dir, imgsz, head_module):
+    import nncf
+    import openvino as ov
+
+    model = ov.Core().read_model(source_path)
+    images = list(calibration_images(calibration_dir, imgsz))
+    # Box decoding in the detection head stays in float, for the same reason as in _quantize_onnx
+    ignored_scope = nncf.IgnoredScope(patterns=[f".*{head_module}/.*/{op}" for op in ("Add", "Sub", "Mul", "Div")]
+                                      + [r".*\.dfl.*"], types=["Sigmoid"], validate=False)
+    quantized = nncf.quantize(model, nncf.Dataset(images), preset=nncf.QuantizationPreset.MIXED,
+                              subset_size=len(images), ignored_scope=ignored_scope)
+    ov.save_model(quantized, output_path)
+
+
+def exported_model_dir(model_path, backend, int8=False, imgsz=640, cache_dir=None):
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(model_path)), "model_cache")
+    return os.path.join(cache_dir, f"{stem}_{backend}{'_int8' if int8 else ''}_{imgsz}")
+
+
+def export_model(model_path, backend, int8=False, calibration_dir=None, imgsz=640, cache_dir=None):
+    """
+    Export model_path for backend once and return (model file, metadata).
+
+    Exports live in cache_dir (model_cache/ next to the model by default) with
+    a metadata.json recording the source model's size and mtime, so they are
+    reused until the .pt file changes. INT8 models are quantized from the
+    images in calibration_dir.
+    """
+    if backend not in BACKENDS or backend == "pytorch":
+        raise ValueError(f"Cannot export to {backend!r}, expected one of {BACKENDS[1:]}")
+    if int8 and not calibration_dir:
+        raise ValueError("INT8 quantization needs a calibration_dir of sample images")
+
+    target_dir = exported_model_dir(model_path, backend, int8, imgsz, cache_dir)
+    model_file = os.path.join(target_dir, "model.onnx" if backend == "onnx" else "model.xml")
+    metadata_path = os.path.join(target_dir, "metadata.json")
+    stat = os.stat(model_path)
+    source = {"path": os.path.abspath(model_path), "size": stat.st_size, "mtime": stat.st_mtime,
+              "calibration_dir": os.path.abspath(calibration_dir) if int8 else None}
+    if os.path.exists(metadata_path) and os.path.exists(model_file):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        if metadata.get("source") == source:
+            return model_file, metadata
+
+    print(f"Exporting {model_path} to {backend}{' INT8' if int8 else ''}, this only happens once...")
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+    names = {int(class_id): name for class_id, name in model.names.items()}
+    # ultralytics writes the export next to the .pt; it is moved into the cache afterwards
+    exported = model.export(format=backend, imgsz=imgsz, dynamic=True, half=False, int8=False)
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.makedirs(target_dir)
+    if backend == "onnx":
+        fp32_file = os.path.join(target_dir, "model_fp32.onnx" if int8 else "model.onnx")
+        shutil.move(exported, fp32_file)
+        if int8:
+            _quantize_onnx(fp32_file, model_file, calibration_dir, imgsz)
+            os.remove(fp32_file)
+    else:
+        for name in os.listdir(exported):
+            if name.endswith((".xml", ".bin")):
+                shutil.move(os.path.join(exported, name),
+                            os.path.join(target_dir, "model" + os.path.splitext(name)[1]))
+        shutil.rmtree(exported, ignore_errors=True)
+        if int8:
+            fp32_file = os.path.join(target_dir, "model_fp32.xml")
+            os.rename(model_file, fp32_file)
+            os.rename(model_file[:-4] + ".bin", fp32_file[:-4] + ".bin")
+            _quantize_openvino(fp32_file, model_file, calibration_dir, imgsz,
+                               head_module=f"model.{len(model.model.model) - 1}")
+            os.remove(fp32_file)
+            os.remove(fp32_file[:-4] + ".bin")
+
+    metadata = {"source": source, "backend": backend, "int8": int8, "imgsz": imgsz,
+                "names": {str(class_id): name for class_id, name in names.items()}}
+    with open(metadata_path, "w") as f:
+        json.dump(metadata, f, indent=2)
+    return model_file, metadata
+
+
+def load_backend(model_path, backend="pytorch", threads=None, int8=False, calibration_dir=None,
+                 imgsz=640, cache_dir=None):
+    """Return (model, model_id) for backend; the model is called like an ultralytics YOLO model"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    stat = os.stat(model_path)
+    model_id = f"{os.path.abspath(model_path)}:{stat.st_mtime}:{backend}{':int8' if int8 else ''}"
+
+    if backend == "pytorch":
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return YOLO(model_path), model_id
+
+    model_file, metadata = export_model(model_path, backend, int8, calibration_dir, imgsz, cache_dir)
+    names = {int(class_id): name for class_id, name in metadata["names"].items()}
+    model_class = OnnxModel if backend == "onnx" else OpenVinoModel
+    return model_class(model_file, names, imgsz=metadata["imgsz"], threads=threads), model_id
@@ -0,0 +1,84 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def frame_key(model_id, frame):
+    """Cache key for a frame: model identity plus a hash of shape, dtype and pixels"""
+    frame = np.ascontiguousarray(frame)
+    digest = hashlib.blake2b(frame.data, digest_size=16)
+    digest.update(f"{frame.shape}{frame.dtype}".encode())
+    return model_id, digest.hexdigest()
+
+
+class DetectionCache:
+    """
+    Bounded LRU cache of raw (unthresholded) detections keyed by frame content.
+
+    Entries are evicted least-recently-used first once either max_entries or
+    max_bytes is exceeded. hits, misses and evictions are kept for reporting.
+    Safe to share between the processing thread and the Tk main thread.
+    """
+
+    # Rough per-entry cost of the key, OrderedDict slot and Detections object
+    ENTRY_OVERHEAD = 256
+
+    def __init__(self, max_entries=256, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, detections):
+        size = self._size_of(detections)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (detections, size)
+            self.current_bytes += size
+            while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _size_of(self, detections):
+        return (detections.boxes.nbytes + detections.confidences.nbytes
+                + detections.class_ids.nbytes + self.ENTRY_OVERHEAD)
@@ -0,0 +1,497 @@
+import argparse
+import glob
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import cv2
+
+from detector import YOLODetector
+from controller import YOLOController
+from backends import BACKENDS, export_model
+from export import EXPORT_FORMATS, DetectionSink
+from history import COUNT_KEYS, DetectionStore, parse_duration
+from metrics import JsonLogSink, Metrics, PrometheusSink
+from motion import MotionGate
+from multistream import MultiStreamController
+from recorder import CONTAINER_CODECS, RECORD_MODES
+from regions import FrameRegions, parse_roi
+from server import InferenceServer
+from sharding import process_video_sharded
+from tracking import ObjectTracker
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov")
+
+
+def collect_inputs(patterns):
+    """Expand files, directories and glob patterns into a sorted list of media files"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern)
+            if not candidates:
+                print(f"Warning: No files match {pattern}")
+        for path in candidates:
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS):
+                paths.append(os.path.abspath(path))
+    return sorted(set(paths))
+
+
+class BatchProcessor:
+    """
+    Processes image and video files without a display.
+
+    Each worker thread owns its own YOLODetector and YOLOController, so files
+    are processed in parallel without sharing a model between threads.
+    Annotated outputs are written to output_dir and every detection is
+    streamed to detections.jsonl (or detections.parquet) in the same
+    directory through one shared DetectionSink.
+
+    With shards > 1, each video is instead split into frame ranges processed
+    by that many worker processes (see sharding.process_video_sharded).
+    With save_output False only detections are written and frames are never
+    annotated.
+    """
+
+    def __init__(self, output_dir, model_path="waste_classification_model.pt",
+                 confidence=0.6, workers=1, batch_size=4, shards=1, save_output=True,
+                 motion_refresh=0, metrics=None, container=".mp4", codec=None, export_format="jsonl",
+                 store=None, detector_options=None, track_interval=0, stride=1, interval=None,
+                 regions_for=None):
+        self.output_dir = output_dir
+        self.model_path = model_path
+        self.confidence = confidence
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.shards = shards
+        self.save_output = save_output
+        self.motion_refresh = motion_refresh  # > 0 enables motion gating with this forced-refresh interval
+        self.metrics = metrics
+        self.container = container  # Extension of annotated videos
+        self.codec = codec  # fourcc, or None for the container's default
+        self.export_format = export_format  # "jsonl" or "parquet"
+        self.store = store  # Optional DetectionStore shared by all workers
+        self.detector_options = detector_options or {}  # Extra YOLODetector arguments, e.g. backend
+        self.track_interval = track_interval  # > 0 tracks objects, detecting every N frames
+        self.stride = stride  # Only every stride-th video frame is processed
+        self.interval = interval  # Or one video frame every interval seconds
+        self.regions_for = regions_for  # Optional path -> FrameRegions or None
+        self.unique_counts = Counter()  # Tracked items per waste category over all videos
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._used_names = set()
+        self._sink = None
+
+    def run(self, paths):
+        os.makedirs(self.output_dir, exist_ok=True)
+        failures = 0
+        export_path = os.path.join(self.output_dir, f"detections.{self.export_format}")
+        with DetectionSink(export_path, self.export_format) as self._sink:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self.process_file, path): path for path in paths}
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        print(f"Error processing {path}: {str(e)}")
+                        ok = False
+                    if not ok:
+                        failures += 1
+                    print(f"{'Done' if ok else 'Failed'}: {path}")
+        self._sink = None
+        return failures
+
+    def process_file(self, path):
+        if self.shards > 1 and path.lower().endswith(VIDEO_EXTENSIONS):
+            return self.process_video_sharded(path)
+
+        motion_gate = MotionGate(refresh_interval=self.motion_refresh) if self.motion_refresh > 0 else None
+        tracker = ObjectTracker(keyframe_interval=self.track_interval) if self.track_interval > 0 else None
+        controller = YOLOController(self._get_detector(), None, None, sink=self._sink, store=self.store,
+                                    batch_size=self.batch_size, video_pacing="fast",
+                                    save_output=self.save_output, motion_gate=motion_gate,
+                                    metrics=self.metrics, codec=self.codec, tracker=tracker,
+                                    regions=self._regions_for(path))
+        output_path = self._output_path_for(path) if self.save_output else None
+        try:
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                return controller.process_image(path, output_path)
+            if not controller.process_video(path, output_path, stride=self.stride, interval=self.interval):
+                return False
+            controller.wait()
+            if tracker is not None:
+                with self._lock:
+                    self.unique_counts.update(tracker.unique_counts)
+            return True
+        finally:
+            controller.stop()
+
+    def process_video_sharded(self, path):
+        output_path = self._output_path_for(path) if self.save_output else None
+        detections = process_video_sharded(path, output_path, model_path=self.model_path,
+                                           confidence=self.confidence, workers=self.shards,
+                                           batch_size=self.batch_size, codec=self.codec,
+                                           detector_options=self.detector_options,
+                                           regions=self._regions_for(path))
+        if detections is None:
+            return False
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        processed_at = time.time()
+        for frame_index, detected_objects in enumerate(detections):
+            position = frame_index / fps if fps > 0 else None
+            self._sink.write(path, frame_index, position, detected_objects)
+            if self.store is not None:
+                self.store.add(path, frame_index, processed_at, position, detected_objects)
+        return True
+
+    def _regions_for(self, path):
+        return self.regions_for(path) if self.regions_for is not None else None
+
+    def _get_detector(self):
+        # One model per worker thread
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = YOLODetector(self.model_path, **self.detector_options)
+            detector.confidence_threshold = self.confidence
+            detector.metrics = self.metrics
+            self._local.detector = detector
+        return detector
+
+    def _output_path_for(self, path):
+        stem, ext = os.path.splitext(os.path.basename(path))
+        ext = ".jpg" if ext.lower() in IMAGE_EXTENSIONS else self.container
+        with self._lock:
+            name = f"{stem}_annotated{ext}"
+            counter = 1
+            while name in self._used_names:
+                name = f"{stem}_annotated_{counter}{ext}"
+                counter += 1
+            self._used_names.add(name)
+        return os.path.join(self.output_dir, name)
+
+
+def start_metrics(args):
+    """Metrics registry plus the sinks requested on the command line"""
+    metrics = Metrics()
+    sinks = []
+    if args.metrics_port is not None:
+        sinks.append(PrometheusSink(metrics, port=args.metrics_port))
+    if args.metrics_log:
+        sinks.append(JsonLogSink(metrics, args.metrics_log, interval=args.metrics_interval))
+    for sink in sinks:
+        sink.start()
+    return metrics, sinks
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this localhost port")
+    parser.add_argument("--metrics-log", help="Append periodic JSON metrics snapshots to this file")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="Seconds between JSON snapshots")
+
+
+def add_recording_arguments(parser):
+    parser.add_argument("--container", default=".mp4", choices=sorted(CONTAINER_CODECS),
+                        help="File type of annotated videos")
+    parser.add_argument("--codec", help="fourcc of annotated videos (default depends on the container)")
+
+
+def add_backend_arguments(parser):
+    parser.add_argument("--backend", default="pytorch", choices=BACKENDS,
+                        help="Inference runtime; onnx/openvino models are exported once and cached")
+    parser.add_argument("--threads", type=int, help="Inference threads per model")
+    parser.add_argument("--int8", action="store_true", help="Quantize the exported model to INT8")
+    parser.add_argument("--calibration-dir", help="Sample images used to calibrate --int8")
+
+
+def roi_argument(value):
+    """(source or None for every source, (x, y, w, h)) from [SOURCE=]x,y,w,h"""
+    source, _, region = value.rpartition("=")
+    try:
+        return source or None, parse_roi(region)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def add_region_arguments(parser):
+    parser.add_argument("--roi", action="append", default=[], type=roi_argument, metavar="[SOURCE=]X,Y,W,H",
+                        help="Only infer this region (fractions of the frame, or pixels); repeatable, "
+                             "SOURCE limits it to one input")
+    parser.add_argument("--tile", type=int, metavar="SIZE",
+                        help="Split regions larger than SIZE pixels into overlapping tiles for small objects")
+    parser.add_argument("--tile-overlap", type=float, default=0.2, help="Fraction of a tile shared with its neighbour")
+
+
+def region_factory(args):
+    """source -> FrameRegions (or None) for the --roi/--tile options, None if they are not used"""
+    if not args.roi and not args.tile:
+        return None
+
+    def regions_for(source):
+        # A SOURCE can be given as on the command line, as a file name or as a path
+        source = str(source)
+        names = {source, os.path.basename(source), os.path.abspath(source)}
+        selected = [roi for only, roi in args.roi
+                    if only is None or only in names or os.path.abspath(only) in names]
+        if not selected and not args.tile:
+            return None
+        return FrameRegions(selected, tile_size=args.tile, overlap=args.tile_overlap)
+
+    return regions_for
+
+
+def detector_options(args):
+    return {"backend": args.backend, "threads": args.threads, "int8": args.int8,
+            "calibration_dir": args.calibration_dir}
+
+
+def prepare_backend(args):
+    """Export the model up front, so parallel workers do not all try to at once"""
+    if args.backend == "pytorch" or not os.path.exists(args.model):
+        return True
+    try:
+        export_model(args.model, args.backend, args.int8, args.calibration_dir)
+    except Exception as e:
+        print(f"Error exporting model to {args.backend}: {str(e)}")
+        return False
+    return True
+
+
+def segment_bytes(megabytes):
+    return int(megabytes * 1024 * 1024) if megabytes else None
+
+
+def run_streams(args):
+    """Run several webcams/videos at once through one shared detector"""
+    os.makedirs(args.output_dir, exist_ok=True)
+    metrics, sinks = start_metrics(args)
+    detector = YOLODetector(args.model, **detector_options(args))
+    detector.confidence_threshold = args.confidence
+    detector.metrics = metrics
+    controller = MultiStreamController(detector, batch_size=args.batch_size, codec=args.codec,
+                                       live_record=args.record,
+                                       max_segment_bytes=segment_bytes(args.max_segment_mb))
+    store = DetectionStore(args.store) if args.store else None
+    regions_for = region_factory(args)
+    export_path = os.path.join(args.output_dir, f"detections.{args.export_format}")
+    with DetectionSink(export_path, args.export_format) as detection_sink:
+        def on_detections(stream_id, packet, detected_objects):
+            stream = controller.streams[stream_id]
+            # Position in the file for videos, capture time (Unix epoch) for webcams
+            timestamp = packet.index / stream.fps if stream.fps > 0 else packet.timestamp
+            detection_sink.write(stream.source, packet.index, timestamp, detected_objects)
+            if store is not None:
+                store.add(stream.source, packet.index, packet.timestamp,
+                          timestamp if stream.fps > 0 else None, detected_objects)
+
+        for i, source in enumerate(args.sources):
+            source = int(source) if source.isdigit() else source
+            output_path = None if args.no_save else os.path.join(args.output_dir, f"stream_{i}{args.container}")
+            controller.add_stream(source, output_path=output_path, on_detections=on_detections,
+                                  regions=regions_for(source) if regions_for is not None else None)
+
+        if controller.start() == 0:
+            print("Error: No streams could be opened")
+            return 1
+        try:
+            while not controller.wait(timeout=1.0):
+                pass
+        except KeyboardInterrupt:
+            print("Stopping streams")
+        finally:
+            controller.stop()
+            for sink in sinks:
+                sink.stop()
+            if store is not None:
+                store.close()
+
+    for stats in controller.stats():
+        print(f"{stats['source']}: {stats['frames_processed']} frames, {stats['fps']:.1f} FPS, "
+              f"{stats['frames_dropped']} dropped")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Waste Classification System (headless)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    process = subparsers.add_parser("process", help="Process images and videos without the GUI")
+    process.add_argument("inputs", nargs="+", help="Files, directories or glob patterns")
+    process.add_argument("-o", "--output-dir", default="output", help="Where annotated files and detections are written")
+    process.add_argument("-m", "--model", default="waste_classification_model.pt", help="Path to the YOLO model")
+    process.add_argument("-c", "--confidence", type=float, default=0.6, help="Confidence threshold")
+    add_backend_arguments(process)
+    process.add_argument("-w", "--workers", type=int, default=1, help="Number of files processed in parallel")
+    process.add_argument("-b", "--batch-size", type=int, default=4, help="Video frames per model call")
+    process.add_argument("--no-save", action="store_true", help="Only write detections, skip annotated outputs")
+    process.add_argument("--export-format", default="jsonl", choices=EXPORT_FORMATS,
+                         help="detections.jsonl, or detections.parquet (needs pyarrow)")
+    process.add_argument("--motion-refresh", type=int, default=0,
+                         help="Skip inference on unchanged frames, forcing a refresh every N frames (0 disables)")
+    process.add_argument("--track-interval", type=int, default=0,
+                         help="Track objects between detections, running the model every N frames (0 disables)")
+    process.add_argument("--stride", type=int, default=1,
+                         help="Only process every Nth video frame, skipping the others without decoding")
+    process.add_argument("--every", type=float, metavar="SECONDS",
+                         help="Only process one video frame every SECONDS, seeking between them")
+    process.add_argument("-s", "--shards", type=int, default=1, help="Split each video across this many worker processes")
+    add_region_arguments(process)
+    add_recording_arguments(process)
+    process.add_argument("--store", help="Also record detections in this SQLite history database")
+    add_metrics_arguments(process)
+
+    streams = subparsers.add_parser("streams", help="Run several webcams/videos at once with one shared model")
+    streams.add_argument("sources", nargs="+", help="Webcam indices or video files")
+    streams.add_argument("-o", "--output-dir", default="output", help="Where stream_N videos and detections are written")
+    streams.add_argument("-m", "--model", default="waste_classification_model.pt", help="Path to the YOLO model")
+    streams.add_argument("-c", "--confidence", type=float, default=0.6, help="Confidence threshold")
+    add_backend_arguments(streams)
+    streams.add_argument("-b", "--batch-size", type=int, default=4, help="Frames per shared model call")
+    streams.add_argument("--no-save", action="store_true", help="Only write detections, skip annotated outputs")
+    add_region_arguments(streams)
+    streams.add_argument("--export-format", default="jsonl", choices=EXPORT_FORMATS,
+                         help="detections.jsonl, or detections.parquet (needs pyarrow)")
+    add_recording_arguments(streams)
+    streams.add_argument("--record", default="detections", choices=RECORD_MODES,
+                         help="Webcams record every frame or only segments with detections")
+    streams.add_argument("--max-segment-mb", type=float, help="Start a new output file past this size")
+    streams.add_argument("--store", help="Also record detections in this SQLite history database")
+    add_metrics_arguments(streams)
+
+    serve = subparsers.add_parser("serve", help="Serve detections over HTTP on this machine")
+    serve.add_argument("-m", "--model", default="waste_classification_model.pt", help="Path to the YOLO model")
+    serve.add_argument("-c", "--confidence", type=float, default=0.6, help="Confidence threshold")
+    add_backend_arguments(serve)
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    serve.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    serve.add_argument("--max-batch-size", type=int, default=8, help="Most frames per model call")
+    serve.add_argument("--max-delay-ms", type=float, default=10.0,
+                       help="Longest a frame waits for its batch to fill")
+    serve.add_argument("--max-queue", type=int, default=64,
+                       help="Queued frames before requests are rejected with 503")
+
+    history = subparsers.add_parser("history", help="Query the detection history database")
+    history.add_argument("--db", default="detection_history.db", help="History database written by --store or the GUI")
+    history.add_argument("--since", help="Only detections this recent, e.g. 90s, 15m, 1h, 7d")
+    history.add_argument("--until", help="Only detections at least this old, same format as --since")
+    history.add_argument("--class", dest="class_name", help="Only this class, e.g. \"Broken glass\"")
+    history.add_argument("--category", help="Only this waste category")
+    history.add_argument("--source", help="Only this source file or webcam index")
+    history.add_argument("--counts", choices=COUNT_KEYS, help="Count detections per category, class or source")
+    history.add_argument("--bucket", help="With --counts, count per time bucket of this length, e.g. 1h")
+    history.add_argument("--limit", type=int, default=50, help="Max detections listed")
+    return parser
+
+
+def run_process(args):
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("Error: No images or videos to process")
+        return 1
+
+    # Shard workers are passed the ROI/tile options but none of these
+    unsharded = [option for option, used in (("--stride", args.stride > 1), ("--every", args.every is not None),
+                                             ("--track-interval", args.track_interval > 0),
+                                             ("--motion-refresh", args.motion_refresh > 0)) if used]
+    if args.shards > 1 and unsharded:
+        print(f"Error: {', '.join(unsharded)} cannot be combined with --shards")
+        return 1
+    if args.track_interval > 0 and args.motion_refresh > 0:
+        # The tracker already skips detection between keyframes, the motion gate would never run
+        print("Error: --motion-refresh cannot be combined with --track-interval")
+        return 1
+
+    print(f"Processing {len(paths)} file(s) with {args.workers} worker(s)")
+    if not prepare_backend(args):
+        return 1
+    metrics, sinks = start_metrics(args)
+    processor = BatchProcessor(args.output_dir, model_path=args.model, confidence=args.confidence,
+                               workers=args.workers, batch_size=args.batch_size, shards=args.shards,
+                               save_output=not args.no_save, motion_refresh=args.motion_refresh,
+                               metrics=metrics, container=args.container, codec=args.codec,
+                               export_format=args.export_format,
+                               store=DetectionStore(args.store) if args.store else None,
+                               detector_options=detector_options(args), track_interval=args.track_interval,
+                               stride=args.stride, interval=args.every, regions_for=region_factory(args))
+    try:
+        failures = processor.run(paths)
+    finally:
+        for sink in sinks:
+            sink.stop()
+        if processor.store is not None:
+            processor.store.close()
+    print(f"Finished: {len(paths) - failures} succeeded, {failures} failed")
+    if processor.unique_counts:
+        print("Unique items: " + ", ".join(f"{category}: {count}"
+                                           for category, count in processor.unique_counts.most_common()))
+    return 1 if failures else 0
+
+
+def run_serve(args):
+    if not prepare_backend(args):
+        return 1
+    detector = YOLODetector(args.model, lazy=True, **detector_options(args))
+    detector.confidence_threshold = args.confidence
+    detector.load_async()  # /health answers "loading" until the model is ready
+    server = InferenceServer(detector, host=args.host, port=args.port, max_batch_size=args.max_batch_size,
+                             max_delay=args.max_delay_ms / 1000, max_queue=args.max_queue)
+    server.run()
+    return 0
+
+
+def run_history(args):
+    if not os.path.exists(args.db):
+        print(f"Error: No history database at {args.db}")
+        return 1
+    now = time.time()
+    start = now - parse_duration(args.since) if args.since else None
+    end = now - parse_duration(args.until) if args.until else None
+    filters = dict(start=start, end=end, class_name=args.class_name, waste_category=args.category,
+                   source=args.source)
+    store = DetectionStore(args.db)
+    try:
+        query_start = time.perf_counter()
+        if args.counts and args.bucket:
+            rows = store.timeline(parse_duration(args.bucket), by=args.counts, **filters)
+            lines = [f"{datetime.fromtimestamp(bucket):%Y-%m-%d %H:%M:%S}  {key:<24} {count}"
+                     for bucket, key, count in rows]
+        elif args.counts:
+            rows = store.counts(by=args.counts, **filters)
+            lines = [f"{key:<24} {count}" for key, count in rows.items()]
+        else:
+            rows = store.query(limit=args.limit, **filters)
+            lines = [f"{datetime.fromtimestamp(row['time']):%Y-%m-%d %H:%M:%S}  {row['source']}"
+                     f"#{row['frame']}  {row['class']} ({row['waste_category']}) {row['confidence']:.2f}"
+                     for row in rows]
+        elapsed = time.perf_counter() - query_start
+    finally:
+        store.close()
+    print("\n".join(lines) if lines else "No matching detections")
+    print(f"({len(rows)} row(s) in {elapsed * 1000:.1f} ms)")
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "process":
+        return run_process(args)
+    if args.command == "streams":
+        return run_streams(args)
+    if args.command == "serve":
+        return run_serve(args)
+    if args.command == "history":
+        return run_history(args)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
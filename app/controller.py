@@ -1,130 +1,331 @@
 import cv2
-import threading
 import time
-from utils import resize_for_display, save_image, save_video_writer
+from metrics import stage_timer
+from pacing import FramePacer
+from pipeline import FramePipeline
+from recorder import AsyncVideoWriter
+from sampling import VideoSampler
+from utils import resize_for_display, save_image
 
 class YOLOController:
-    def __init__(self, detector, update_frame_callback, update_text_callback):
+    def __init__(self, detector, update_frame_callback, update_text_callback, queue_size=4,
+                 batch_size=4, max_batch_wait=0.05, video_pacing="source", webcam_pacing="live",
+                 save_output=True, motion_gate=None, metrics=None, codec=None, video_record="all",
+                 webcam_record="detections", pre_roll=30, post_roll=60, max_segment_bytes=None,
+                 sink=None, store=None, tracker=None, regions=None):
         self.detector = detector
+        # (frame, frame_index=None) -> None, or None when nothing displays frames
         self.update_frame = update_frame_callback
-        self.update_text = update_text_callback
+        self.update_text = update_text_callback  # None when nothing shows detections
         self.cap = None
+        self.current_frame = None  # Original pixels of the image being shown, for refreshes
         self.current_mode = None
         self.is_paused = False
         self.output_path = None
+        self.output_paths = []  # Every file the last recording was split into
         self.video_writer = None
-        self.processing_thread = None
+        self.save_output = save_output  # Write annotated images/videos
+        self.codec = codec  # fourcc, or None for the container's default
+        self.video_record = video_record  # "all" or "detections", see AsyncVideoWriter
+        self.webcam_record = webcam_record
+        self.pre_roll = pre_roll  # Frames kept before the first detection of a segment
+        self.post_roll = post_roll  # Frames kept after the last detection of a segment
+        self.max_segment_bytes = max_segment_bytes  # Start a new file past this size
+        self.queue_size = queue_size  # Max frames buffered between pipeline stages
+        self.batch_size = batch_size  # Frames per model call when processing video files
+        self.max_batch_wait = max_batch_wait  # Max seconds to wait for a batch to fill
+        self.video_pacing = video_pacing  # "fast", "source" or "live", see FramePacer
+        self.webcam_pacing = webcam_pacing
+        self.motion_gate = motion_gate  # Optional MotionGate, reuses detections on unchanged frames
+        self.tracker = tracker  # Optional ObjectTracker, detects on keyframes only (takes precedence over motion_gate)
+        self.regions = regions  # Optional FrameRegions, infers only ROIs/tiles of each frame
+        self.metrics = metrics  # Optional Metrics registry for per-stage timings and counters
+        self.sink = sink  # Optional DetectionSink every frame's detections are exported to
+        self.store = store  # Optional DetectionStore keeping a queryable history
+        self.source_name = None
+        self.source_fps = 0.0
+        self.source_frame_count = 0  # Frames in the video file, 0 for webcams
+        self.sampler = None  # VideoSampler while a video is processed with stride/interval sampling
+        self.pacer = None
+        self.pipeline = None
 
-    def process_image(self, image_path):
+    def process_image(self, image_path, output_path=None):
         self.stop()
+        self.output_paths = []
         frame = cv2.imread(image_path)
         if frame is None:
             print(f"Error: Could not read image from {image_path}")
-            return
+            return False
         
         self.current_mode = "image"
-        annotated_frame, detected_objects = self.detector.predict(frame)
-        self.update_frame(annotated_frame)
-        self.update_text(detected_objects)
-        
-        # Save the output
-        self.output_path = save_image(annotated_frame)
+        self.current_frame = frame
+        detected_objects = self._detect(frame, cached=True)
+        if self._needs_annotation():
+            annotated_frame = self.detector.annotate(frame.copy(), detected_objects)
+            if self.update_frame is not None:
+                self.update_frame(annotated_frame)
+            
+            # Save the output
+            if self.save_output:
+                self.output_path = save_image(annotated_frame, output_path)
+                self.output_paths = [self.output_path]
+        if self.sink is not None:
+            self.sink.write(image_path, 0, None, detected_objects)
+        if self.store is not None:
+            self.store.add(image_path, 0, time.time(), None, detected_objects)
+        if self.update_text is not None:
+            self.update_text(detected_objects)
+        return True
 
-    def process_video(self, video_path):
+    def process_video(self, video_path, output_path=None, stride=1, interval=None):
+        """Process every stride-th frame, or one frame every interval seconds, of a video file"""
         self.stop()
+        self.output_paths = []
         self.cap = cv2.VideoCapture(video_path)
         if not self.cap.isOpened():
             print(f"Error: Could not open video file {video_path}")
-            return
+            return False
         
         self.current_mode = "video"
         self.is_paused = False
+        self.source_name = video_path
+        self.source_fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.source_frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if stride > 1 or interval is not None:
+            self.sampler = VideoSampler(self.cap, stride=stride, interval=interval)
         
-        # Get video properties
-        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = self.cap.get(cv2.CAP_PROP_FPS)
-        
-        # Create output video writer
-        output_filename = f"output_{int(time.time())}.mp4"
-        self.video_writer = save_video_writer(output_filename, fps, width, height)
-        self.output_path = output_filename
+        # Create output video writer; files must not lose frames, so it applies backpressure
+        if self.save_output:
+            output_filename = output_path or f"output_{int(time.time())}.mp4"
+            self._start_recording(output_filename, self._output_fps(), self.video_record, block=True)
         
-        # Start processing thread
-        self.processing_thread = threading.Thread(target=self._process_video_thread)
-        self.processing_thread.daemon = True
-        self.processing_thread.start()
+        # Start processing pipeline
+        self._start_pipeline()
+        return True
 
-    def start_webcam(self, device_index=0):
+    def start_webcam(self, device_index=0, output_path=None):
         self.stop()
+        self.output_paths = []
         self.cap = cv2.VideoCapture(device_index)
         if not self.cap.isOpened():
             print(f"Error: Could not open webcam device {device_index}")
-            return
+            return False
         
         self.current_mode = "webcam"
         self.is_paused = False
+        self.source_name = str(device_index)
+        self.source_fps = 0.0
+        self.source_frame_count = 0
         
-        # Get webcam properties
-        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        # Keep the driver's buffer short so live mode sees the newest frame
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         
-        # Create output video writer
-        output_filename = f"webcam_{int(time.time())}.mp4"
-        self.video_writer = save_video_writer(output_filename, fps, width, height)
-        self.output_path = output_filename
+        # Create output video writer. The reported FPS is often 0 or wrong for webcams and
+        # live pacing drops frames, so the writer measures the rate frames actually arrive at
+        if self.save_output:
+            output_filename = output_path or f"webcam_{int(time.time())}.mp4"
+            self._start_recording(output_filename, None, self.webcam_record, block=False)
         
-        # Start processing thread
-        self.processing_thread = threading.Thread(target=self._process_video_thread)
-        self.processing_thread.daemon = True
-        self.processing_thread.start()
-
-    def _process_video_thread(self):
-        while self.cap is not None and self.cap.isOpened() and self.current_mode in ["video", "webcam"]:
-            if self.is_paused:
-                time.sleep(0.1)
-                continue
-                
-            ret, frame = self.cap.read()
-            if not ret:
-                break
-                
-            annotated_frame, detected_objects = self.detector.predict(frame)
-            
+        # Start processing pipeline
+        self._start_pipeline()
+        return True
+
+    def _start_recording(self, output_path, fps, record, block):
+        self.video_writer = AsyncVideoWriter(output_path, fps, codec=self.codec, record=record,
+                                             pre_roll=self.pre_roll, post_roll=self.post_roll,
+                                             max_bytes=self.max_segment_bytes, block=block,
+                                             metrics=self.metrics)
+        self.output_path = output_path
+        self.output_paths = self.video_writer.paths
+        if self.metrics is not None:
+            self.metrics.add_collector("recorder", self.video_writer.stats)
+
+    def _start_pipeline(self):
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        if self.tracker is not None:
+            self.tracker.reset()
+        # Batch video files for throughput; webcams run frame by frame to keep latency low
+        batch_size = self.batch_size if self.current_mode == "video" else 1
+        mode = self.video_pacing if self.current_mode == "video" else self.webcam_pacing
+        self.pacer = FramePacer(mode, source_fps=self._output_fps())
+        self.pipeline = FramePipeline(self._read_frame, self._infer_batch, self._emit_frame,
+                                      queue_size=max(self.queue_size, batch_size),
+                                      batch_size=batch_size,
+                                      max_batch_wait=self.max_batch_wait,
+                                      pacer=self.pacer,
+                                      frame_index=self._sampled_index if self.sampler is not None else None,
+                                      frame_position=self._sampled_position if self.sampler is not None else None)
+        if self.metrics is not None:
+            self.metrics.add_collector("pacer", self.pacer.stats)
+            if self.sampler is not None:
+                self.metrics.add_collector("sampler", self.sampler.stats)
+            if self.motion_gate is not None:
+                self.metrics.add_collector("motion", self.motion_gate.stats)
+            if self.tracker is not None:
+                self.metrics.add_collector("tracker", self.tracker.stats)
+            if self.detector.cache is not None:
+                self.metrics.add_collector("cache", self.detector.cache.stats)
+        self.pipeline.start()
+
+    def _read_frame(self):
+        # Capture stage: decode the next frame from the source
+        if self.cap is None or not self.cap.isOpened():
+            return None
+        with stage_timer(self.metrics, "read"):
+            if self.sampler is not None:
+                frame = self.sampler.read()
+            else:
+                ret, frame = self.cap.read()
+                frame = frame if ret else None
+        if frame is not None and self.metrics is not None:
+            self.metrics.increment("frames_read")
+        return frame
+
+    def _sampled_index(self):
+        return self.sampler.index
+
+    def _sampled_position(self):
+        return self.sampler.position
+
+    def _output_fps(self):
+        # Sampled videos are written and paced at the rate of the frames kept, so they keep their length
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if self.sampler is not None and fps > 0:
+            return fps / self.sampler.step
+        return fps
+
+    def _infer_batch(self, packets):
+        # Inference stage: detection only, annotation happens at output
+        if self.tracker is not None:
+            return self._infer_tracked(packets)
+        if self.motion_gate is not None:
+            return self._infer_gated(packets)
+        return self._detect_batch([packet.frame for packet in packets])
+
+    def _detect_batch(self, frames, cached=False):
+        # Only still images use the detector's cache, pipeline frames rarely repeat
+        if self.regions is not None:
+            return self.regions.detect_batch(self.detector, frames, cached)
+        if len(frames) == 1:
+            return [self.detector.detect(frames[0], cached)]
+        return self.detector.detect_batch(frames, cached)
+
+    def _detect(self, frame, cached=False):
+        return self._detect_batch([frame], cached)[0]
+
+    def _infer_gated(self, packets):
+        # Only frames that changed go to the model, the rest reuse the detections
+        # of the last changed frame before them (or of the previous batch)
+        previous = self.motion_gate.detections
+        inferred = []
+        sources = []
+        for i, packet in enumerate(packets):
+            if self.motion_gate.check(packet.frame):
+                inferred.append(i)
+            sources.append(len(inferred) - 1)
+
+        detected = self._detect_batch([packets[i].frame for i in inferred]) if inferred else []
+        if detected:
+            self.motion_gate.update(detected[-1])
+        return [detected[j] if j >= 0 else previous for j in sources]
+
+    def _infer_tracked(self, packets):
+        # Keyframes due by interval are detected in one batch; the tracker can ask for
+        # extra ones (new or uncertain tracks) and propagates boxes on every other frame
+        planned = self.tracker.plan(len(packets))
+        detected = dict(zip(planned, self._detect_batch([packets[i].frame for i in planned])))
+        outputs = []
+        for i, packet in enumerate(packets):
+            if i not in detected and self.tracker.needs_detection():
+                detected[i] = self._detect(packet.frame)
+            if i in detected:
+                outputs.append(self.tracker.update(detected[i]))
+            else:
+                outputs.append(self.tracker.predict())
+        return outputs
+
+    def _needs_annotation(self):
+        return self.update_frame is not None or self.save_output
+
+    def _emit_frame(self, packet, detected_objects):
+        # Encode/display stage: only frames that are written or shown get annotated
+        if self.video_writer is not None or self.update_frame is not None:
+            annotated_frame = self.detector.annotate(packet.frame, detected_objects)
             if self.video_writer is not None:
-                self.video_writer.write(annotated_frame)
-                
-            self.update_frame(annotated_frame)
+                with stage_timer(self.metrics, "write"):
+                    self.video_writer.write(annotated_frame, len(detected_objects) > 0, packet.timestamp)
+            if self.update_frame is not None:
+                with stage_timer(self.metrics, "display"):
+                    self.update_frame(annotated_frame, packet.index)
+
+        position = self._position(packet)
+        if self.sink is not None:
+            self.sink.write(self.source_name, packet.index,
+                            packet.timestamp if position is None else position, detected_objects)
+        if self.store is not None:
+            self.store.add(self.source_name, packet.index, packet.timestamp, position, detected_objects)
+        if self.update_text is not None:
             self.update_text(detected_objects)
-            
-            # Control frame rate
-            time.sleep(1/30)  # Assuming 30 FPS
+        
+        if self.metrics is not None:
+            self.metrics.increment("frames_processed")
+            self.metrics.mark("frames")
+            self.metrics.observe("latency", time.time() - packet.timestamp)
+
+    def _position(self, packet):
+        # Seconds into the file for videos, None for live sources
+        if packet.position is not None:
+            return packet.position  # From the sampler, also right when the fps is unknown
+        if self.source_fps > 0:
+            return packet.index / self.source_fps
+        return None
+
+    def measured_fps(self):
+        """Frames actually processed per second recently, or None without metrics"""
+        if self.metrics is None:
+            return None
+        return self.metrics.rate("frames")
+
+    def wait(self, timeout=None):
+        """Block until the current video has been fully processed"""
+        if self.pipeline is not None:
+            return self.pipeline.wait(timeout)
+        return True
 
     def pause_video(self):
         if self.current_mode in ["video", "webcam"]:
             self.is_paused = not self.is_paused
+            if self.pipeline is not None:
+                if self.is_paused:
+                    self.pipeline.pause()
+                else:
+                    self.pipeline.resume()
 
     def stop(self):
         self.current_mode = None
+        self.current_frame = None
         self.is_paused = False
         
+        # Stop the pipeline before releasing the resources its stages use
+        if self.pipeline is not None:
+            self.pipeline.stop(timeout=1.0)
+            self.pipeline = None
+        
         if self.cap is not None:
             self.cap.release()
             self.cap = None
+        self.sampler = None
             
         if self.video_writer is not None:
             self.video_writer.release()
             self.video_writer = None
-            
-        if self.processing_thread is not None:
-            self.processing_thread.join(timeout=1.0)
-            self.processing_thread = None
 
     def refresh_current_frame(self):
-        if self.current_mode == "image" and self.cap is not None:
-            ret, frame = self.cap.read()
-            if ret:
-                annotated_frame, detected_objects = self.detector.predict(frame)
-                self.update_frame(annotated_frame)
+        """Re-run detection on the shown image, e.g. after the confidence threshold changed"""
+        if self.current_mode == "image" and self.current_frame is not None:
+            detected_objects = self._detect(self.current_frame, cached=True)
+            if self.update_frame is not None:
+                self.update_frame(self.detector.annotate(self.current_frame.copy(), detected_objects))
+            if self.update_text is not None:
                 self.update_text(detected_objects)
@@ -0,0 +1,95 @@
+import numpy as np
+
+
+class Detections:
+    """
+    Detections for one frame kept as parallel NumPy arrays.
+
+    boxes is an (N, 4) array of x1, y1, x2, y2 pixel coordinates, confidences
+    and class_ids are length-N arrays. Class names and waste categories are
+    resolved through per-model lookup arrays indexed by class id, so no
+    per-box Python objects are created unless a caller asks for them.
+
+    Iterating or indexing with an int yields the same dicts predict() used to
+    return ({'class', 'confidence', 'box', 'waste_category'}), which keeps
+    older dict-based callers working. Detections that went through an
+    ObjectTracker also carry track_ids, added to the dicts as 'track_id'.
+    """
+
+    def __init__(self, boxes, confidences, class_ids, class_names, categories, track_ids=None):
+        self.boxes = boxes
+        self.confidences = confidences
+        self.class_ids = class_ids
+        self.class_lookup = class_names  # class id -> class name
+        self.category_lookup = categories  # class id -> waste category
+        self.track_ids = track_ids  # Optional length-N array of persistent track ids
+
+    @classmethod
+    def empty(cls, class_names, categories):
+        return cls(np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                   np.zeros(0, dtype=np.int32), class_names, categories)
+
+    @classmethod
+    def from_array(cls, data, class_names, categories):
+        """Build from an (N, 6) array of x1, y1, x2, y2, confidence, class_id rows"""
+        data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+        return cls(data[:, :4], data[:, 4], data[:, 5].astype(np.int32), class_names, categories)
+
+    def __len__(self):
+        return len(self.confidences)
+
+    @property
+    def class_names(self):
+        return self.class_lookup[self.class_ids]
+
+    @property
+    def waste_categories(self):
+        return self.category_lookup[self.class_ids]
+
+    def select(self, index):
+        """Subset by boolean mask, index array or slice"""
+        return Detections(self.boxes[index], self.confidences[index], self.class_ids[index],
+                          self.class_lookup, self.category_lookup,
+                          self.track_ids[index] if self.track_ids is not None else None)
+
+    def filter(self, min_confidence):
+        """Detections with confidence >= min_confidence"""
+        mask = self.confidences >= min_confidence
+        if mask.all():
+            return self
+        return self.select(mask)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            class_id = int(self.class_ids[index])
+            item = {
+                'class': self.class_lookup[class_id],
+                'confidence': float(self.confidences[index]),
+                'box': self.boxes[index].tolist(),
+                'waste_category': self.category_lookup[class_id],
+            }
+            if self.track_ids is not None:
+                item['track_id'] = int(self.track_ids[index])
+            return item
+        return self.select(index)
+
+    def __iter__(self):
+        return iter(self.to_dicts())
+
+    def to_dicts(self):
+        """One plain dict per detection, JSON serialisable"""
+        boxes = self.boxes.tolist()
+        confidences = self.confidences.tolist()
+        class_names = self.class_names.tolist()
+        categories = self.waste_categories.tolist()
+        items = [
+            {'class': name, 'confidence': confidence, 'box': box, 'waste_category': category}
+            for name, confidence, box, category in zip(class_names, confidences, boxes, categories)
+        ]
+        if self.track_ids is not None:
+            for item, track_id in zip(items, self.track_ids.tolist()):
+                item['track_id'] = track_id
+        return items
+
+    def __repr__(self):
+        return f"Detections({len(self)} objects)"
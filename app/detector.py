@@ -1,12 +1,30 @@
-from ultralytics import YOLO
 import os
 import sys
+import threading
+import time
 import cv2
+import numpy as np
+
+from backends import load_backend
+from cache import frame_key
+from detections import Detections
+from metrics import stage_timer
+from utils import draw_detections
 
 class YOLODetector:
-    def __init__(self, model_path="waste_classification_model.pt"):
+    def __init__(self, model_path="waste_classification_model.pt", cache=None, lazy=False, model=None,
+                 backend="pytorch", threads=None, int8=False, calibration_dir=None):
         self.confidence_threshold = 0.6  # Default confidence threshold
         
+        # Optional DetectionCache, used only by calls that pass cached=True (still images).
+        # Cached results are inferred at raw_confidence so a threshold change only
+        # re-filters them instead of running the model again.
+        self.cache = cache
+        self.raw_confidence = 0.01
+        
+        # Optional Metrics registry for inference/postprocess/annotate timings and cache counters
+        self.metrics = None
+        
         # Define the 5 waste classes and their classifications
         self.waste_categories = {
             'plastic': 'Reduce or Recycle',
@@ -16,20 +34,95 @@ class YOLODetector:
             'metal cans': 'Reuse, Recycle'
         }
         
-        try:
-            print(f"Loading model from: {model_path}")
-            if not os.path.exists(model_path):
-                print(f"Error: Model file not found at {model_path}")
-                print("Please ensure the model file exists in the correct location.")
+        self.model_path = model_path
+        # Inference runtime: "pytorch", or "onnx"/"openvino" exported once and cached
+        # (see backends.py), optionally INT8-quantized from calibration_dir images
+        self.backend = backend
+        self.threads = threads  # Inference threads, None for the runtime's default
+        self.int8 = int8
+        self.calibration_dir = calibration_dir
+        self.model = None
+        self.ready = threading.Event()  # Set once the model is loaded (or failed to load)
+        self.load_error = None
+        self.load_time = None
+        self.warmup_time = None
+        
+        # A preloaded model (anything called like an ultralytics YOLO model, e.g. a
+        # benchmark stub) is used as-is instead of loading model_path
+        if model is not None:
+            self._use_model(model, f"{type(model).__name__}:{id(model)}")
+            self.ready.set()
+        # lazy=True leaves loading to load_async() so callers such as the GUI can start immediately
+        elif not lazy:
+            try:
+                self._load_model()
+            except FileNotFoundError:
                 sys.exit(1)
-                
-            self.model = YOLO(model_path)
-            print("Model loaded successfully!")
-            print(f"Available classes: {list(self.model.names.values())}")
-        except Exception as e:
-            print(f"Error loading model: {str(e)}")
-            print("Please ensure the model file is a valid YOLO model.")
-            sys.exit(1)
+            except Exception as e:
+                print(f"Error loading model: {str(e)}")
+                print("Please ensure the model file is a valid YOLO model.")
+                sys.exit(1)
+            self.ready.set()
+
+    def _load_model(self):
+        print(f"Loading model from: {self.model_path}")
+        if not os.path.exists(self.model_path):
+            print(f"Error: Model file not found at {self.model_path}")
+            print("Please ensure the model file exists in the correct location.")
+            raise FileNotFoundError(self.model_path)
+        
+        # torch/ultralytics or the chosen runtime are only imported here
+        start = time.perf_counter()
+        model, model_id = load_backend(self.model_path, self.backend, threads=self.threads, int8=self.int8,
+                                       calibration_dir=self.calibration_dir)
+        self._use_model(model, model_id)
+        self.load_time = time.perf_counter() - start
+        print(f"Model loaded successfully! ({self.backend}{' INT8' if self.int8 else ''})")
+        print(f"Available classes: {list(self.model.names.values())}")
+
+    def _use_model(self, model, model_id):
+        self.model = model
+        self.model_id = model_id
+        self._build_lookups(model.names)
+
+    def load_async(self, warmup=True):
+        """Load the model (and run a warm-up inference) on a background thread"""
+        def load():
+            try:
+                self._load_model()
+                if warmup:
+                    self.warmup()
+            except Exception as e:
+                print(f"Error loading model: {str(e)}")
+                self.load_error = e
+            finally:
+                self.ready.set()
+
+        thread = threading.Thread(target=load, name="model-loader")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def warmup(self, width=640, height=480):
+        """Run one dummy inference so the first real frame does not pay for lazy initialisation"""
+        start = time.perf_counter()
+        self.model(np.zeros((height, width, 3), dtype=np.uint8), conf=self.confidence_threshold)
+        self.warmup_time = time.perf_counter() - start
+
+    def wait_ready(self, timeout=None):
+        """Block until the model is loaded; False on timeout or load failure"""
+        return self.ready.wait(timeout) and self.load_error is None
+
+    def _build_lookups(self, names):
+        """Precompute class id -> class name and class id -> waste category arrays"""
+        size = max(names) + 1 if names else 0
+        self.class_names = np.empty(size, dtype=object)
+        self.category_lookup = np.empty(size, dtype=object)
+        for class_id in range(size):
+            class_name = names.get(class_id, str(class_id))
+            self.class_names[class_id] = class_name
+            self.category_lookup[class_id] = self.get_waste_category(class_name)
+        self.no_detections = Detections.empty(self.class_names, self.category_lookup)
 
     def get_waste_category(self, class_name):
         """Get the waste category (Reduce, Reuse, Recycle) for a detected object"""
@@ -37,40 +130,91 @@ class YOLODetector:
         class_name_lower = class_name.lower()
         return self.waste_categories.get(class_name_lower, 'Recycle')
 
-    def predict(self, frame):
-        if frame is None:
-            print("Error: Input frame is None")
-            return None, []
-            
-        try:
+    def detect(self, frame, cached=False):
+        """Run the model on one frame and return its Detections, without annotating"""
+        return self.detect_batch([frame], cached)[0]
+
+    def detect_batch(self, frames, cached=False):
+        """Run several frames through the model in one call, one Detections per frame.
+
+        With cached=True the frames are looked up in (and added to) the cache.
+        Hashing costs milliseconds per frame and streamed frames rarely repeat,
+        so only frames that are likely to be inferred again should ask for it.
+        """
+        cache = self.cache if cached else None
+        if not self.wait_ready():
+            raise RuntimeError(f"Model {self.model_path} is not available: {self.load_error}")
+        outputs = [self.no_detections] * len(frames)
+        pending = []  # (index, cache key) of frames that need the model
+        for i, frame in enumerate(frames):
             # Ensure frame is in correct format
+            if frame is None:
+                print("Error: Input frame is None")
+                continue
             if len(frame.shape) != 3:
                 print("Error: Invalid frame format")
-                return frame, []
-                
-            results = self.model(frame, conf=self.confidence_threshold)[0]
-            if not results or len(results) == 0:
-                return frame, []
-                
-            # Return annotated frame and list of detected objects
-            annotated_frame = results.plot()
-            detected_objects = []
-            
-            for r in results.boxes.data.tolist():
-                x1, y1, x2, y2, confidence, class_id = r
-                class_name = results.names[int(class_id)]
-                
-                if confidence >= self.confidence_threshold:
-                    waste_category = self.get_waste_category(class_name)
-                    detected_objects.append({
-                        'class': class_name,
-                        'confidence': confidence,
-                        'box': [x1, y1, x2, y2],
-                        'waste_category': waste_category
-                    })
-            
-            return annotated_frame, detected_objects
-            
+                continue
+
+            key = None
+            if cache is not None:
+                key = frame_key(self.model_id, frame)
+                hit = cache.get(key)
+                if self.metrics is not None:
+                    self.metrics.increment("cache_hits" if hit is not None else "cache_misses")
+                if hit is not None:
+                    outputs[i] = hit.filter(self.confidence_threshold)
+                    continue
+            pending.append((i, key))
+
+        if not pending:
+            return outputs
+
+        try:
+            conf = self.confidence_threshold
+            if cache is not None:
+                conf = min(conf, self.raw_confidence)
+            batch = [frames[i] for i, _ in pending]
+            with stage_timer(self.metrics, "inference"):
+                results = self.model(batch if len(batch) > 1 else batch[0], conf=conf)
+            with stage_timer(self.metrics, "postprocess"):
+                for (i, key), result in zip(pending, results):
+                    detections = self._to_detections(result)
+                    if key is not None:
+                        cache.put(key, detections)
+                        detections = detections.filter(self.confidence_threshold)
+                    outputs[i] = detections
         except Exception as e:
-            print(f"Error during prediction: {str(e)}")
-            return frame, []  # Return original frame and empty list on error
+            print(f"Error during prediction: {str(e)}")  # Frames keep no detections on error
+
+        return outputs
+
+    def annotate(self, frame, detections):
+        """Draw detections onto frame in place and return it"""
+        if frame is None or len(detections) == 0:
+            return frame
+        with stage_timer(self.metrics, "annotate"):
+            return draw_detections(frame, detections)
+
+    def predict(self, frame):
+        """Returns (annotated_frame, Detections) for one frame; frame is annotated in place"""
+        detections = self.detect(frame)
+        return self.annotate(frame, detections), detections
+
+    def predict_batch(self, frames):
+        """Run several frames through the model in one call.
+
+        Returns one (annotated_frame, detected_objects) tuple per input frame,
+        in the same order, exactly as predict() would for each frame.
+        """
+        return [(self.annotate(frame, detections), detections)
+                for frame, detections in zip(frames, self.detect_batch(frames))]
+
+    def _to_detections(self, results):
+        if not results or len(results) == 0:
+            return self.no_detections
+            
+        # The model already applied the confidence threshold, so the rows are used as-is
+        data = results.boxes.data
+        if hasattr(data, "cpu"):
+            data = data.cpu().numpy()
+        return Detections.from_array(data, self.class_names, self.category_lookup)
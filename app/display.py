@@ -0,0 +1,70 @@
+import threading
+
+
+class DisplayBridge:
+    """
+    Hands frames and detections from processing threads to the Tk main loop.
+
+    Worker threads call publish_frame/publish_detections, which only store the
+    latest value in a single slot under a lock and return immediately. The Tk
+    main loop polls the slot with after() at no more than max_fps and renders
+    whatever is newest, so intermediate frames are coalesced instead of
+    queueing Tk work, and all widget access stays on the main thread.
+    """
+
+    def __init__(self, root, render_frame, render_detections, max_fps=30):
+        self.root = root
+        self.render_frame = render_frame
+        self.render_detections = render_detections
+        self.interval_ms = max(1, int(1000 / max_fps))
+        self.frames_published = 0
+        self.frames_shown = 0
+        self._lock = threading.Lock()
+        self._frame = None
+        self._detections = None
+        self._after_id = None
+
+    def publish_frame(self, frame, frame_index=None):
+        """frame_index is the source frame the image shows, passed on to render_frame"""
+        with self._lock:
+            self._frame = (frame, frame_index)
+            self.frames_published += 1
+
+    def publish_detections(self, detections):
+        with self._lock:
+            self._detections = detections
+
+    def clear(self):
+        """Drop anything not yet shown, e.g. after processing was stopped"""
+        with self._lock:
+            self._frame = None
+            self._detections = None
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(self.interval_ms, self._poll)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    @property
+    def frames_coalesced(self):
+        return self.frames_published - self.frames_shown
+
+    def _poll(self):
+        with self._lock:
+            frame, detections = self._frame, self._detections
+            self._frame = self._detections = None
+
+        try:
+            if frame is not None:
+                self.render_frame(*frame)
+                self.frames_shown += 1
+            if detections is not None:
+                self.render_detections(detections)
+        except Exception as e:
+            print(f"Error updating display: {str(e)}")
+        finally:
+            self._after_id = self.root.after(self.interval_ms, self._poll)
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from timing import FlushTimer
+
+EXPORT_FORMATS = ("jsonl", "parquet")
+
+
+def export_format_for_path(path):
+    """"parquet" for .parquet files, "jsonl" for anything else"""
+    return "parquet" if os.path.splitext(path)[1].lower() == ".parquet" else "jsonl"
+
+
+class DetectionSink:
+    """
+    Streams detection records to a JSONL or Parquet file with bounded memory.
+
+    Every detection becomes one row: source, frame, timestamp, class,
+    waste_category, confidence and the box (a "box" list in JSONL, x1, y1,
+    x2, y2 columns in Parquet), plus track_id for tracked detections.
+    Frames without detections add no rows.
+
+    write() only keeps a reference to the frame's Detections; rows are built
+    and written in one go once flush_rows have piled up or flush_interval
+    seconds have passed, so memory stays constant however long the run is.
+    A timer thread also flushes rows that have waited flush_interval while
+    no new ones arrived, e.g. from an idle webcam.
+    Parquet output needs pyarrow and writes one row group per flush.
+    write() is thread-safe, so several workers can share one sink.
+    """
+
+    def __init__(self, path, format=None, flush_rows=4096, flush_interval=5.0):
+        self.path = path
+        self.format = format or export_format_for_path(path)
+        if self.format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {self.format!r}, expected one of {EXPORT_FORMATS}")
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._pending = []  # (source, frame, timestamp, Detections)
+        self._pending_rows = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = None
+        self._writer = None
+
+        if self.format == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("Parquet export needs pyarrow: pip install pyarrow")
+            self._pa = pa
+            self._schema = pa.schema([
+                ("source", pa.string()),
+                ("frame", pa.int64()),
+                ("timestamp", pa.float64()),
+                ("class", pa.string()),
+                ("waste_category", pa.string()),
+                ("confidence", pa.float32()),
+                ("x1", pa.float32()),
+                ("y1", pa.float32()),
+                ("x2", pa.float32()),
+                ("y2", pa.float32()),
+                ("track_id", pa.int64()),
+            ])
+            self._writer = pq.ParquetWriter(path, self._schema)
+        else:
+            self._file = open(path, "w", buffering=1024 * 1024)
+        self._timer = FlushTimer(self._flush_if_due, flush_interval, name="export-flush").start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, source, frame_index, timestamp, detections):
+        if not len(detections):
+            return
+        with self._lock:
+            self._pending.append((str(source), frame_index, timestamp, detections))
+            self._pending_rows += len(detections)
+            if (self._pending_rows >= self.flush_rows
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush_if_due(self):
+        with self._lock:
+            if self._pending and time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def close(self):
+        self._timer.stop()
+        with self._lock:
+            self._flush()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        rows, self._pending_rows = self._pending_rows, 0
+        self._last_flush = time.monotonic()
+        if not pending:
+            return
+        if self._writer is not None:
+            self._writer.write_table(self._to_table(pending))
+        elif self._file is not None:
+            lines = []
+            for source, frame_index, timestamp, detections in pending:
+                for row in detections.to_dicts():
+                    lines.append(json.dumps({"source": source, "frame": frame_index, "timestamp": timestamp, **row}))
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+        self.rows_written += rows
+
+    def _to_table(self, pending):
+        counts = [len(detections) for _, _, _, detections in pending]
+        boxes = np.concatenate([detections.boxes for _, _, _, detections in pending])
+        timestamps = [np.nan if timestamp is None else timestamp for _, _, timestamp, _ in pending]
+        columns = {
+            "source": np.repeat(np.array([source for source, _, _, _ in pending], dtype=object), counts),
+            "frame": np.repeat(np.array([frame for _, frame, _, _ in pending], dtype=np.int64), counts),
+            "timestamp": np.repeat(np.array(timestamps, dtype=np.float64), counts),
+            "class": np.concatenate([detections.class_names for _, _, _, detections in pending]),
+            "waste_category": np.concatenate([detections.waste_categories for _, _, _, detections in pending]),
+            "confidence": np.concatenate([detections.confidences for _, _, _, detections in pending]),
+            "x1": boxes[:, 0],
+            "y1": boxes[:, 1],
+            "x2": boxes[:, 2],
+            "y2": boxes[:, 3],
+            "track_id": [track_id for _, _, _, detections in pending
+                         for track_id in (detections.track_ids.tolist() if detections.track_ids is not None
+                                          else [None] * len(detections))],
+        }
+        return self._pa.Table.from_pydict(
+            {name: self._pa.array(values, type=self._schema.field(name).type, from_pandas=True)
+             for name, values in columns.items()},
+            schema=self._schema)
@@ -2,25 +2,45 @@ import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.scrolled import ScrolledText
 from tkinter import filedialog, messagebox
-import cv2
+import numpy as np
+import threading
 from datetime import datetime
+from PIL import Image, ImageTk
 
+from cache import DetectionCache
 from detector import YOLODetector
 from controller import YOLOController
-from utils import resize_for_display
+from display import DisplayBridge
+from history import DetectionStore
+from metrics import Metrics
+from timing import StartupTimer
+from tracking import ObjectTracker
+from utils import DisplaySurface, probe_cameras
 
 class YOLOApp:
-    def __init__(self, root):
+    def __init__(self, root, timer=None):
         self.root = root
+        self.timer = timer or StartupTimer()
         self.root.title("Waste Classification System")
         self.root.geometry("1400x800")  # Increased height for frame details
         
         # Set theme
         self.style = ttk.Style("darkly")
         
-        # Detector + Controller
-        self.detector = YOLODetector()
-        self.controller = YOLOController(self.detector, self.update_frame, self.update_text)
+        # Detector + Controller. The model is loaded in the background once the window
+        # is up. The controller publishes results through the display bridge;
+        # update_frame/update_text only ever run on the Tk main thread.
+        self.metrics = Metrics()
+        self.store = DetectionStore("detection_history.db")
+        self.detector = YOLODetector(cache=DetectionCache(), lazy=True)
+        self.detector.metrics = self.metrics
+        self.display_bridge = DisplayBridge(self.root, self.update_frame, self.update_text, max_fps=30)
+        self.controller = YOLOController(self.detector, self.display_bridge.publish_frame,
+                                         self.display_bridge.publish_detections,
+                                         metrics=self.metrics,
+                                         max_segment_bytes=512 * 1024 * 1024,
+                                         store=self.store,
+                                         tracker=ObjectTracker(keyframe_interval=5))
 
         # Main container
         self.main_container = ttk.Frame(root)
@@ -43,15 +63,18 @@ class YOLOApp:
                                     command=self.start_webcam, width=20)
         self.btn_webcam.pack(pady=5, fill=X)
 
-        # Webcam selection
+        # Webcam selection, filled in when background camera discovery finishes
         self.device_var = ttk.StringVar(self.left_panel)
         self.device_dropdown = None
-        self.detected_devices = self.detect_cameras()
-        if self.detected_devices:
-            self.device_var.set(self.detected_devices[0])
-            self.device_dropdown = ttk.OptionMenu(self.left_panel, self.device_var, 
-                                                *self.detected_devices)
-            self.device_dropdown.pack(pady=5, fill=X)
+        self.detected_devices = None
+        self.device_frame = ttk.Frame(self.left_panel)
+        self.device_frame.pack(fill=X)
+        self.device_status = ttk.Label(self.device_frame, text="Searching for cameras...")
+        self.device_status.pack(pady=5)
+
+        # Model status
+        self.model_status = ttk.Label(self.left_panel, text="Loading model...")
+        self.model_status.pack(pady=5)
 
         # Confidence threshold control
         threshold_frame = ttk.LabelFrame(self.left_panel, text="Confidence Threshold", padding=10)
@@ -93,6 +116,10 @@ class YOLOApp:
 
         self.frame_label = ttk.Label(self.video_frame)
         self.frame_label.pack(expand=YES)
+        
+        # Reused for every displayed frame: letterbox buffer and Tk photo image
+        self.display_surface = DisplaySurface(width=800, height=480)
+        self.frame_photo = None
 
         # Frame details section
         details_frame = ttk.LabelFrame(self.display_frame, text="Frame Details", padding=10)
@@ -122,6 +149,21 @@ class YOLOApp:
         self.total_frames_label = ttk.Label(self.details_grid, text="--")
         self.total_frames_label.grid(row=1, column=3, sticky=W, padx=5)
 
+        # Measured inference latency
+        ttk.Label(self.details_grid, text="Inference:").grid(row=2, column=0, sticky=W, padx=5)
+        self.inference_label = ttk.Label(self.details_grid, text="--")
+        self.inference_label.grid(row=2, column=1, sticky=W, padx=5)
+
+        # Frames dropped to keep up with a live source
+        ttk.Label(self.details_grid, text="Dropped:").grid(row=2, column=2, sticky=W, padx=5)
+        self.dropped_label = ttk.Label(self.details_grid, text="--")
+        self.dropped_label.grid(row=2, column=3, sticky=W, padx=5)
+
+        # Distinct tracked items per waste category since the video/webcam started
+        ttk.Label(self.details_grid, text="Unique Items:").grid(row=3, column=0, sticky=W, padx=5)
+        self.unique_items_label = ttk.Label(self.details_grid, text="--")
+        self.unique_items_label.grid(row=3, column=1, columnspan=3, sticky=W, padx=5)
+
         # Prediction details section
         prediction_frame = ttk.LabelFrame(self.display_frame, text="Prediction Details", padding=10)
         prediction_frame.pack(fill=X, pady=(0, 10))
@@ -184,36 +226,118 @@ class YOLOApp:
         self.history_tree.pack(side=LEFT, fill=BOTH, expand=YES)
         scrollbar.pack(side=RIGHT, fill=Y)
 
-    def update_frame(self, frame):
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        resized = resize_for_display(rgb, width=800, height=480)
-        from PIL import Image, ImageTk
-        img = Image.fromarray(resized)
-        imgtk = ImageTk.PhotoImage(img)
-        self.frame_label.imgtk = imgtk
-        self.frame_label.configure(image=imgtk)
+        # Per-category counts from the persistent history database
+        stored_frame = ttk.LabelFrame(self.right_panel, text="Stored History", padding=10)
+        stored_frame.pack(fill=X, pady=(10, 0))
+        
+        self.history_ranges = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 604800}
+        self.history_range_var = ttk.StringVar(value="Last hour")
+        history_range = ttk.Combobox(stored_frame, textvariable=self.history_range_var,
+                                     values=list(self.history_ranges), state="readonly", width=15)
+        history_range.pack(fill=X)
+        history_range.bind("<<ComboboxSelected>>", lambda event: self.refresh_stored_history(reschedule=False))
+        
+        self.stored_history_label = ttk.Label(stored_frame, text="No detections stored", justify=LEFT)
+        self.stored_history_label.pack(fill=X, pady=(5, 0))
+        self.history_thread = None  # Queries the store off the Tk thread
+        self.stored_counts = None  # Its latest result, shown by show_stored_history
+        self.history_poll_id = None
+
+        # What update_text last rendered, so unchanged widgets are not touched
+        self.shown_text = None
+        self.shown_rows = []
+        self.seen_tracks = set()  # Track ids already listed in the history
+
+        # Start rendering published frames
+        self.display_bridge.start()
+        self.history_after_id = self.root.after(1000, self.refresh_stored_history)
+
+        # Load the model and look for cameras in the background so the window appears immediately
+        self.set_inputs_enabled(False)
+        self.detector.load_async()
+        self.root.after(100, self.check_model_ready)
+        camera_thread = threading.Thread(target=self.discover_cameras, name="camera-discovery")
+        camera_thread.daemon = True
+        camera_thread.start()
+        self.root.after(100, self.check_cameras_ready)
+
+    def set_inputs_enabled(self, enabled):
+        state = NORMAL if enabled else DISABLED
+        for button in (self.btn_img, self.btn_video, self.btn_webcam):
+            button.configure(state=state)
+
+    def check_model_ready(self):
+        if not self.detector.ready.is_set():
+            self.root.after(100, self.check_model_ready)
+            return
+        
+        if self.detector.load_error is not None:
+            messagebox.showerror("Model", f"Could not load model from {self.detector.model_path}:\n"
+                                          f"{self.detector.load_error}")
+            self.on_close()
+            return
+        
+        self.timer.record("model load", self.detector.load_time)
+        if self.detector.warmup_time is not None:
+            self.timer.record("model warm-up", self.detector.warmup_time)
+        self.model_status.configure(text="Model ready")
+        self.set_inputs_enabled(True)
+        self.startup_finished()
+
+    def check_cameras_ready(self):
+        if self.detected_devices is None:
+            self.root.after(100, self.check_cameras_ready)
+            return
+        
+        self.device_status.destroy()
+        if self.detected_devices:
+            self.device_var.set(self.detected_devices[0])
+            self.device_dropdown = ttk.OptionMenu(self.device_frame, self.device_var, 
+                                                self.detected_devices[0], *self.detected_devices)
+            self.device_dropdown.pack(pady=5, fill=X)
+        self.startup_finished()
+
+    def startup_finished(self):
+        # Print timings once both background startup tasks are done
+        if self.detector.ready.is_set() and self.detected_devices is not None:
+            self.timer.report()
+
+    def update_frame(self, frame, frame_index=None):
+        # Downscale first, then convert BGR->RGB on the small image, into a reused buffer
+        img = Image.fromarray(self.display_surface.render(frame))
+        if self.frame_photo is None:
+            self.frame_photo = ImageTk.PhotoImage(img)
+        else:
+            self.frame_photo.paste(img)
+        self.frame_label.imgtk = self.frame_photo
+        self.frame_label.configure(image=self.frame_photo)
 
         # Update frame details
         height, width = frame.shape[:2]
         self.resolution_label.configure(text=f"{width}x{height}")
         
+        # Measured processing rate and latency rather than the container's nominal FPS
+        inference = self.metrics.percentile("inference", 50)
+        if inference is not None:
+            self.inference_label.configure(text=f"{inference * 1000:.0f} ms")
+        
         if self.controller.current_mode == "video":
-            if self.controller.cap is not None:
-                fps = self.controller.cap.get(cv2.CAP_PROP_FPS)
-                total_frames = int(self.controller.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                current_frame = int(self.controller.cap.get(cv2.CAP_PROP_POS_FRAMES))
-                
-                self.fps_label.configure(text=f"{fps:.2f}")
-                self.frame_count_label.configure(text=str(current_frame))
-                self.total_frames_label.configure(text=str(total_frames))
+            # The shown frame's own index; the capture is read on another thread and runs ahead
+            self.fps_label.configure(text=f"{self.controller.measured_fps():.2f}")
+            if frame_index is not None:
+                self.frame_count_label.configure(text=str(frame_index + 1))
+            self.total_frames_label.configure(text=str(self.controller.source_frame_count))
         elif self.controller.current_mode == "webcam":
-            self.fps_label.configure(text="Live")
+            self.fps_label.configure(text=f"{self.controller.measured_fps():.2f} (Live)")
             self.frame_count_label.configure(text="--")
             self.total_frames_label.configure(text="--")
         else:
             self.fps_label.configure(text="--")
             self.frame_count_label.configure(text="--")
             self.total_frames_label.configure(text="--")
+        
+        if self.controller.pacer is not None and self.controller.current_mode in ["video", "webcam"]:
+            self.dropped_label.configure(text=str(self.controller.pacer.frames_dropped))
 
     def update_confidence(self, *args):
         self.detector.confidence_threshold = self.confidence_var.get()
@@ -222,39 +346,45 @@ class YOLOApp:
             self.controller.refresh_current_frame()
 
     def update_text(self, detected_objects):
-        # Update current detection text
-        self.text_output.delete(1.0, END)
+        # Filter objects by confidence threshold on the arrays, build dicts only for what is shown
+        filtered_objects = detected_objects.filter(self.confidence_var.get())
+        rows = []
+        lines = []
+        for obj in filtered_objects:
+            lines.append(f"{obj['class']}: {obj['confidence']:.2f} ({obj['waste_category']})\n")
+            box_coords = f"x1:{obj['box'][0]:.0f}, y1:{obj['box'][1]:.0f}, x2:{obj['box'][2]:.0f}, y2:{obj['box'][3]:.0f}"
+            rows.append((obj['class'], f"{obj['confidence']:.2f}", obj['waste_category'], box_coords))
+        text = "".join(lines) if len(detected_objects) else "No objects detected."
         
-        # Clear previous predictions
-        for item in self.prediction_tree.get_children():
-            self.prediction_tree.delete(item)
-            
-        if detected_objects:
-            for obj in detected_objects:
-                if obj['confidence'] >= self.confidence_var.get():
-                    # Update text output with waste category
-                    self.text_output.insert(END, f"{obj['class']}: {obj['confidence']:.2f} ({obj['waste_category']})\n")
-                    
-                    # Update prediction tree
-                    box_coords = f"x1:{obj['box'][0]:.0f}, y1:{obj['box'][1]:.0f}, x2:{obj['box'][2]:.0f}, y2:{obj['box'][3]:.0f}"
-                    self.prediction_tree.insert("", END, values=(
-                        obj['class'],
-                        f"{obj['confidence']:.2f}",
-                        obj['waste_category'],
-                        box_coords
-                    ))
-        else:
-            self.text_output.insert(END, "No objects detected.")
-
-        # Update history if in video or webcam mode
+        # Update current detection text only when it changed
+        if text != self.shown_text:
+            self.text_output.delete(1.0, END)
+            self.text_output.insert(END, text)
+            self.shown_text = text
+        
+        # Update the prediction tree in place: reuse existing rows, add or remove the difference
+        items = self.prediction_tree.get_children()
+        for i, (item, values) in enumerate(zip(items, rows)):
+            if self.shown_rows[i] != values:
+                self.prediction_tree.item(item, values=values)
+        for values in rows[len(items):]:
+            self.prediction_tree.insert("", END, values=values)
+        if len(items) > len(rows):
+            self.prediction_tree.delete(*items[len(rows):])
+        self.shown_rows = rows
+
+        # Update history if in video or webcam mode. Tracked objects are listed once,
+        # when their track first appears, not again on every frame they stay in view.
         if self.controller.current_mode in ["video", "webcam"]:
             current_time = datetime.now().strftime("%H:%M:%S")
-            # Filter objects by confidence threshold
-            filtered_objects = [obj for obj in detected_objects 
-                              if obj['confidence'] >= self.confidence_var.get()]
-            if filtered_objects:
-                objects_str = ", ".join([f"{obj['class']}({obj['waste_category']})" for obj in filtered_objects])
-                conf_str = ", ".join([f"{obj['confidence']:.2f}" for obj in filtered_objects])
+            if filtered_objects.track_ids is not None:
+                new_tracks = [track_id not in self.seen_tracks for track_id in filtered_objects.track_ids.tolist()]
+                self.seen_tracks.update(filtered_objects.track_ids.tolist())
+                filtered_objects = filtered_objects.select(np.array(new_tracks, dtype=bool))
+            if len(filtered_objects):
+                objects_str = ", ".join([f"{name}({category})" for name, category in
+                                         zip(filtered_objects.class_names, filtered_objects.waste_categories)])
+                conf_str = ", ".join([f"{confidence:.2f}" for confidence in filtered_objects.confidences])
                 
                 # Add to history
                 self.history_tree.insert("", 0, values=(current_time, objects_str, conf_str))
@@ -262,15 +392,48 @@ class YOLOApp:
                 # Keep only last 100 entries
                 if len(self.history_tree.get_children()) > 100:
                     self.history_tree.delete(self.history_tree.get_children()[-1])
+            
+            tracker = self.controller.tracker
+            if tracker is not None and tracker.unique_counts:
+                self.unique_items_label.configure(text=", ".join(
+                    f"{category}: {count}" for category, count in tracker.unique_counts.most_common()))
+
+    def refresh_stored_history(self, reschedule=True):
+        # Counting can take a while on a large history, so it runs on a background thread
+        if self.history_thread is None or not self.history_thread.is_alive():
+            since = self.history_ranges[self.history_range_var.get()]
+            self.history_thread = threading.Thread(target=self.load_stored_history, args=(since,),
+                                                   name="history-query")
+            self.history_thread.daemon = True
+            self.history_thread.start()
+            if self.history_poll_id is None:
+                self.history_poll_id = self.root.after(100, self.show_stored_history)
+        if reschedule:
+            self.history_after_id = self.root.after(5000, self.refresh_stored_history)
+
+    def load_stored_history(self, since):
+        try:
+            self.stored_counts = self.store.counts(start=datetime.now().timestamp() - since, items=True)
+        except Exception as e:
+            print(f"Error reading detection history: {str(e)}")
+
+    def show_stored_history(self):
+        if self.history_thread.is_alive():
+            self.history_poll_id = self.root.after(100, self.show_stored_history)
+            return
+        self.history_poll_id = None
+        if self.stored_counts is not None:
+            text = "\n".join(f"{category}: {count}" for category, count in self.stored_counts.items())
+            self.stored_history_label.configure(text=text or "No detections stored")
 
     def detect_cameras(self):
-        devices = []
-        for i in range(5):  # check first 5 indices
-            cap = cv2.VideoCapture(i)
-            if cap.read()[0]:
-                devices.append(str(i))
-            cap.release()
-        return devices
+        return probe_cameras(range(5), timeout=3.0)  # check first 5 indices
+
+    def discover_cameras(self):
+        # Runs on a background thread; check_cameras_ready picks up the result
+        with self.timer.phase("camera discovery"):
+            devices = self.detect_cameras()
+        self.detected_devices = devices
 
     def select_image(self):
         self.stop()
@@ -304,6 +467,13 @@ class YOLOApp:
 
     def stop(self):
         self.controller.stop()
+        # Write out the rows still buffered so Stored History includes the end of the run
+        try:
+            self.store.flush()
+        except Exception as e:
+            print(f"Error writing detection history: {str(e)}")
+        self.refresh_stored_history(reschedule=False)
+        self.display_bridge.clear()
         self.frame_label.configure(image='')
         self.download_btn.configure(state=DISABLED)
         self.play_pause_btn.configure(state=DISABLED)
@@ -316,19 +486,33 @@ class YOLOApp:
         # Clear predictions
         for item in self.prediction_tree.get_children():
             self.prediction_tree.delete(item)
+        self.shown_text = None
+        self.shown_rows = []
+        self.seen_tracks = set()
             
         # Reset frame details
         self.resolution_label.configure(text="--")
         self.fps_label.configure(text="--")
         self.frame_count_label.configure(text="--")
         self.total_frames_label.configure(text="--")
+        self.inference_label.configure(text="--")
+        self.dropped_label.configure(text="--")
+        self.unique_items_label.configure(text="--")
 
     def download_output(self):
-        if self.controller.output_path:
-            messagebox.showinfo("Download", f"Output saved to {self.controller.output_path}")
+        # Webcam recordings only keep segments with detections and may be split in several files
+        if len(self.controller.output_paths) > 1:
+            messagebox.showinfo("Download", "Output saved to:\n" + "\n".join(self.controller.output_paths))
+        elif self.controller.output_paths:
+            messagebox.showinfo("Download", f"Output saved to {self.controller.output_paths[0]}")
         else:
             messagebox.showwarning("Download", "No output file available")
 
     def on_close(self):
         self.stop()
+        self.display_bridge.stop()
+        self.root.after_cancel(self.history_after_id)
+        if self.history_poll_id is not None:
+            self.root.after_cancel(self.history_poll_id)
+        self.store.close()
         self.root.destroy()
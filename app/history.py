@@ -0,0 +1,182 @@
+import sqlite3
+import threading
+import time
+
+from timing import FlushTimer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    source TEXT NOT NULL,
+    frame INTEGER,
+    position REAL,
+    class TEXT NOT NULL,
+    waste_category TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+    track_id INTEGER
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS detections_time ON detections (time);
+CREATE INDEX IF NOT EXISTS detections_class_time ON detections (class, time);
+CREATE INDEX IF NOT EXISTS detections_category_time ON detections (waste_category, time);
+DROP INDEX IF EXISTS detections_time_keys;
+CREATE INDEX IF NOT EXISTS detections_time_tracks ON detections (time, waste_category, class, source, track_id);
+"""
+
+COUNT_KEYS = ("waste_category", "class", "source")
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(text):
+    """Seconds in a duration like "90s", "15m", "1h", "7d" or a plain number of seconds"""
+    text = str(text).strip().lower()
+    if text and text[-1] in _UNITS:
+        return float(text[:-1]) * _UNITS[text[-1]]
+    return float(text)
+
+
+class DetectionStore:
+    """
+    Persistent detection history in a local SQLite database.
+
+    Every detection is one row with the wall-clock time it was captured, its
+    source, frame index, position in the source (seconds, None for live
+    sources), class, waste category, confidence, box and track id (None
+    unless an ObjectTracker ran). Indexes on time, (class, time) and
+    (waste_category, time) keep range and per-class queries fast without
+    rescanning any video, and (time, waste_category, class, source,
+    track_id) lets counts over a time range read only that range.
+
+    add() is called from processing threads and only buffers rows; they are
+    inserted in one transaction once batch_size rows are pending or
+    flush_interval seconds have passed; a timer thread flushes rows left
+    waiting that long when no more arrive. Queries run on a separate
+    connection per thread, and WAL mode lets them read while a batch is
+    being written.
+    """
+
+    def __init__(self, path="detection_history.db", batch_size=512, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(detections)")]
+        if "track_id" not in columns:  # Database written before tracks were stored
+            self._connection.execute("ALTER TABLE detections ADD COLUMN track_id INTEGER")
+        self._connection.executescript(INDEXES)
+        self._timer = FlushTimer(self._flush_if_due, flush_interval, name="history-flush").start()
+
+    def add(self, source, frame_index, timestamp, position, detections):
+        """Buffer one frame's detections; timestamp is the Unix time it was captured"""
+        if not len(detections):
+            return
+        boxes = detections.boxes.tolist()
+        track_ids = detections.track_ids.tolist() if detections.track_ids is not None else [None] * len(boxes)
+        rows = [
+            (timestamp, str(source), frame_index, position, name, category, confidence, *box, track_id)
+            for name, category, confidence, box, track_id in zip(detections.class_names.tolist(),
+                                                                 detections.waste_categories.tolist(),
+                                                                 detections.confidences.tolist(), boxes,
+                                                                 track_ids)
+        ]
+        with self._lock:
+            self._pending.extend(rows)
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush_if_due(self):
+        with self._lock:
+            if self._pending and time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def close(self):
+        self._timer.stop()
+        with self._lock:
+            self._flush()
+            self._connection.close()
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        self._last_flush = time.monotonic()
+        if not pending:
+            return
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO detections (time, source, frame, position, class, waste_category, confidence,"
+                " x1, y1, x2, y2, track_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", pending)
+        self.rows_written += len(pending)
+
+    def _reader(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def _where(self, start, end, class_name, waste_category, source):
+        clauses, params = [], []
+        for clause, value in (("time >= ?", start), ("time < ?", end), ("class = ?", class_name),
+                              ("waste_category = ?", waste_category), ("source = ?", source)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, start=None, end=None, class_name=None, waste_category=None, source=None, limit=100):
+        """Newest-first detections in [start, end) Unix time, optionally of one class/category/source"""
+        where, params = self._where(start, end, class_name, waste_category, source)
+        sql = "SELECT * FROM detections" + where + " ORDER BY time DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self._reader().execute(sql, params)]
+
+    def counts(self, start=None, end=None, by="waste_category", class_name=None, waste_category=None,
+               source=None, items=False):
+        """Number of detections per waste_category, class or source.
+
+        With items=True tracked detections are counted once per (source,
+        track_id), i.e. per item rather than per frame it was seen in;
+        untracked rows still count once each. Track ids restart with every
+        run, so two runs of one source in the range can share ids.
+        """
+        if by not in COUNT_KEYS:
+            raise ValueError(f"Cannot count by {by!r}, expected one of {COUNT_KEYS}")
+        where, params = self._where(start, end, class_name, waste_category, source)
+        # Left to itself SQLite scans the whole (by, time) index to group; "+" keeps it on the time range
+        group = f"+{by}" if start is not None or end is not None else by
+        count = "COUNT(*)"
+        if items:
+            count = ("COUNT(DISTINCT CASE WHEN track_id IS NOT NULL THEN source || '#' || track_id END)"
+                     " + SUM(track_id IS NULL)")
+        sql = f"SELECT {by}, {count} AS n FROM detections{where} GROUP BY {group} ORDER BY n DESC"
+        return dict(self._reader().execute(sql, params).fetchall())
+
+    def timeline(self, bucket_seconds=3600, start=None, end=None, by="waste_category", class_name=None,
+                 waste_category=None, source=None):
+        """(bucket start, key, count) rows, e.g. per-category counts for every hour of a day"""
+        if by not in COUNT_KEYS:
+            raise ValueError(f"Cannot count by {by!r}, expected one of {COUNT_KEYS}")
+        where, params = self._where(start, end, class_name, waste_category, source)
+        sql = (f"SELECT CAST(time / ? AS INTEGER) * ? AS bucket, {by}, COUNT(*) FROM detections{where}"
+               f" GROUP BY bucket, {by} ORDER BY bucket, {by}")
+        return [tuple(row) for row in self._reader().execute(sql, [bucket_seconds, bucket_seconds] + params)]
@@ -1,8 +1,13 @@
-import ttkbootstrap as ttk
-from gui import YOLOApp
+from timing import StartupTimer
+
+timer = StartupTimer()
+with timer.phase("imports"):
+    import ttkbootstrap as ttk
+    from gui import YOLOApp
 
 if __name__ == "__main__":
-    root = ttk.Window(themename="darkly")
-    app = YOLOApp(root)
+    with timer.phase("window"):
+        root = ttk.Window(themename="darkly")
+        app = YOLOApp(root, timer=timer)
     root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
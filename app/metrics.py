@@ -0,0 +1,227 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def stage_timer(metrics, stage):
+    """metrics.time(stage), or a no-op when metrics is None"""
+    return metrics.time(stage) if metrics is not None else nullcontext()
+
+
+class RollingHistogram:
+    """Latency samples over the last `window` observations plus lifetime count and sum"""
+
+    def __init__(self, window=1024):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        if not self.samples:
+            return {"count": self.count, "sum": self.total}
+        values = np.fromiter(self.samples, dtype=np.float64)
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": float(values.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe registry of stage timings, counters and event rates.
+
+    Stage timings go into rolling histograms (seconds), counters only grow,
+    and rate() measures how often an event was marked over the last few
+    seconds, e.g. real processed FPS. Collectors are callables returning a
+    dict of gauge values, read whenever a snapshot is taken, so components
+    that keep their own statistics (pacer, cache, motion gate) can be
+    exported without pushing every change.
+    """
+
+    def __init__(self, window=1024, rate_window=2.0):
+        self.window = window
+        self.rate_window = rate_window
+        self.histograms = {}
+        self.counters = {}
+        self.collectors = {}
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = RollingHistogram(self.window)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def percentile(self, stage, q=50):
+        """One percentile (seconds) of a stage's recent timings, or None; much cheaper than snapshot()"""
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None or not histogram.samples:
+                return None
+            values = np.fromiter(histogram.samples, dtype=np.float64)
+        return float(np.percentile(values, q))
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def mark(self, event):
+        """Record one occurrence of event for rate()"""
+        now = time.monotonic()
+        with self._lock:
+            events = self._events.get(event)
+            if events is None:
+                events = self._events[event] = deque(maxlen=self.window)
+            events.append(now)
+
+    def rate(self, event):
+        """Occurrences per second over the last rate_window seconds"""
+        now = time.monotonic()
+        with self._lock:
+            events = self._events.get(event)
+            if not events:
+                return 0.0
+            recent = [t for t in events if now - t <= self.rate_window]
+        if len(recent) < 2:
+            return 0.0
+        span = recent[-1] - recent[0]
+        return (len(recent) - 1) / span if span > 0 else 0.0
+
+    def add_collector(self, name, collect):
+        self.collectors[name] = collect
+
+    def remove_collector(self, name):
+        self.collectors.pop(name, None)
+
+    def snapshot(self):
+        with self._lock:
+            stages = {name: histogram.summary() for name, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+            events = list(self._events)
+        gauges = {}
+        for name, collect in list(self.collectors.items()):
+            try:
+                for key, value in collect().items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        gauges[f"{name}_{key}"] = value
+            except Exception as e:
+                print(f"Error collecting metrics from {name}: {str(e)}")
+        for event in events:
+            gauges[f"{event}_per_second"] = self.rate(event)
+        return {"time": time.time(), "stages": stages, "counters": counters, "gauges": gauges}
+
+    def to_prometheus(self, prefix="waste"):
+        """Snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for stage, summary in sorted(snapshot["stages"].items()):
+            name = f"{prefix}_stage_seconds"
+            for quantile in ("p50", "p95", "p99"):
+                if quantile in summary:
+                    lines.append(f'{name}{{stage="{stage}",quantile="0.{quantile[1:]}"}} {summary[quantile]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {summary["count"]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {summary["sum"]:.6f}')
+        for counter, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            lines.append(f"{prefix}_{counter}_total {value}")
+        for gauge, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"# TYPE {prefix}_{gauge} gauge")
+            lines.append(f"{prefix}_{gauge} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusSink:
+    """Serves Metrics at http://host:port/metrics in the Prometheus text format"""
+
+    def __init__(self, metrics, port=9108, host="127.0.0.1"):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.server = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes out of the console
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever, name="metrics-http")
+        thread.daemon = True
+        thread.start()
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class JsonLogSink:
+    """Appends a JSON snapshot of Metrics to a file every `interval` seconds"""
+
+    def __init__(self, metrics, path, interval=10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics-log")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(self.metrics.snapshot()) + "\n")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write()  # Final snapshot
@@ -0,0 +1,76 @@
+import cv2
+
+
+class MotionGate:
+    """
+    Cheap change detector that decides whether a frame needs the model.
+
+    Frames are shrunk to a small grayscale thumbnail and compared with the
+    thumbnail of the last frame that was actually inferred. If the fraction
+    of pixels that changed by more than pixel_threshold stays below
+    motion_threshold, the previous detections are reused. A full inference
+    is still forced every refresh_interval frames so slow drift and items
+    that arrive without much motion are eventually picked up.
+    """
+
+    def __init__(self, motion_threshold=0.01, pixel_threshold=25, thumbnail_width=160,
+                 refresh_interval=30):
+        self.motion_threshold = motion_threshold  # Fraction of changed pixels that counts as motion
+        self.pixel_threshold = pixel_threshold  # Per-pixel gray level difference that counts as change
+        self.thumbnail_width = thumbnail_width
+        self.refresh_interval = refresh_interval  # Force inference after this many skipped frames
+        self.frames_inferred = 0
+        self.frames_skipped = 0
+        self.detections = None  # Detections of the reference frame
+        self._reference = None
+        self._since_refresh = 0
+
+    def reset(self):
+        self.detections = None
+        self._reference = None
+        self._since_refresh = 0
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        width = min(self.thumbnail_width, w)
+        height = max(1, int(h * width / w))
+        small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        # Blur away sensor noise so it does not register as motion
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def check(self, frame):
+        """
+        Returns True when frame differs enough from the reference to need the
+        model. That frame then becomes the new reference; pass its detections
+        to update() once they are known. On False, reuse `detections`.
+        """
+        thumbnail = self._thumbnail(frame)
+        needs_inference = (self._reference is None or self.detections is None
+                           or self._reference.shape != thumbnail.shape
+                           or self._since_refresh >= self.refresh_interval)
+        if not needs_inference:
+            diff = cv2.absdiff(thumbnail, self._reference)
+            _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+            needs_inference = cv2.countNonZero(mask) > self.motion_threshold * diff.size
+
+        if needs_inference:
+            self._reference = thumbnail
+            self._since_refresh = 0
+            self.frames_inferred += 1
+        else:
+            self._since_refresh += 1
+            self.frames_skipped += 1
+        return needs_inference
+
+    def update(self, detections):
+        """Store the detections of the current reference frame"""
+        self.detections = detections
+
+    def stats(self):
+        total = self.frames_inferred + self.frames_skipped
+        return {
+            "frames_inferred": self.frames_inferred,
+            "frames_skipped": self.frames_skipped,
+            "skip_rate": self.frames_skipped / total if total else 0.0,
+        }
@@ -0,0 +1,305 @@
+import queue
+import threading
+import time
+
+import cv2
+
+from pipeline import FramePacket
+from recorder import AsyncVideoWriter
+from regions import detect_regions
+
+# Marks the end of a stream on its queues
+_END = object()
+
+
+class VideoStream:
+    """One webcam or video file handled by a MultiStreamController"""
+
+    def __init__(self, stream_id, source, output_path=None, on_frame=None, on_detections=None,
+                 queue_size=2, codec=None, record="all", max_segment_bytes=None, regions=None):
+        self.stream_id = stream_id
+        self.source = source
+        self.live = isinstance(source, int)  # Webcam device index
+        self.output_path = output_path
+        self.codec = codec
+        self.record = record  # "all" or "detections", see AsyncVideoWriter
+        self.max_segment_bytes = max_segment_bytes
+        self.regions = regions  # Optional FrameRegions, only these parts of the frame are inferred
+        self.on_frame = on_frame  # (stream_id, annotated_frame) -> None
+        self.on_detections = on_detections  # (stream_id, packet, detections) -> None
+        # Webcams keep only the newest frame, files apply backpressure
+        self.input_queue = queue.Queue(maxsize=1 if self.live else queue_size)
+        self.output_queue = queue.Queue(maxsize=queue_size)
+        self.cap = None
+        self.fps = 0.0  # Source FPS of video files, 0 for webcams
+        self.video_writer = None
+        self.output_paths = []  # Files the recording was split into
+        self.exhausted = False  # No more frames will be read
+        self.finished = False  # Every frame has been emitted
+        self.failed = False  # The output loop died; no more frames are routed here
+        self.frames_read = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.started_at = None
+        self.finished_at = None
+
+    def open(self):
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            print(f"Error: Could not open stream {self.source}")
+            return False
+        if self.live:
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        else:
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+
+        if self.output_path is not None:
+            # Webcams drop frames instead of stalling and have their FPS measured by the writer
+            fps = None if self.live else self.cap.get(cv2.CAP_PROP_FPS)
+            self.video_writer = AsyncVideoWriter(self.output_path, fps, codec=self.codec, record=self.record,
+                                                 max_bytes=self.max_segment_bytes, block=not self.live)
+            self.output_paths = self.video_writer.paths
+        return True
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        if self.video_writer is not None:
+            self.video_writer.release()
+            self.video_writer = None
+
+    def stats(self):
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "source": self.source,
+            "frames_read": self.frames_read,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+            "output_paths": self.output_paths,
+            "fps": self.frames_processed / elapsed if elapsed > 0 else 0.0,
+            "finished": self.finished,
+        }
+
+
+class MultiStreamController:
+    """
+    Runs several webcams or video files at once against one shared detector.
+
+    Every stream has its own capture thread, input queue, output thread and
+    optional video writer. A single inference thread builds batches by taking
+    at most one frame per stream per round, starting from the stream after
+    the one served last, so a fast file cannot starve a webcam. Only one model
+    is loaded no matter how many streams run. A stream whose output fails is
+    dropped from routing, and webcam results that do not fit a full output
+    queue are dropped, so neither holds up the other streams.
+    """
+
+    def __init__(self, detector, batch_size=4, max_batch_wait=0.02, queue_size=2, codec=None,
+                 live_record="detections", max_segment_bytes=None):
+        self.detector = detector
+        self.batch_size = batch_size
+        self.max_batch_wait = max_batch_wait
+        self.queue_size = queue_size
+        self.codec = codec  # Output fourcc, or None for the container's default
+        self.live_record = live_record  # Webcams record "all" frames or only "detections" segments
+        self.max_segment_bytes = max_segment_bytes
+        self.streams = []
+        self._next_stream = 0  # Round-robin position
+        self._frame_ready = threading.Condition()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def add_stream(self, source, output_path=None, on_frame=None, on_detections=None, regions=None):
+        """Register a webcam index or video path; returns its stream id"""
+        stream = VideoStream(len(self.streams), source, output_path, on_frame, on_detections,
+                             queue_size=self.queue_size, codec=self.codec,
+                             record=self.live_record if isinstance(source, int) else "all",
+                             max_segment_bytes=self.max_segment_bytes, regions=regions)
+        self.streams.append(stream)
+        return stream.stream_id
+
+    def start(self):
+        opened = [stream for stream in self.streams if stream.open()]
+        for stream in self.streams:
+            if stream not in opened:
+                stream.exhausted = stream.finished = True
+
+        for stream in opened:
+            stream.started_at = time.time()
+            self._spawn(self._capture_loop, stream, f"capture-{stream.stream_id}")
+            self._spawn(self._output_loop, stream, f"output-{stream.stream_id}")
+        self._spawn(self._inference_loop, None, "inference")
+        return len(opened)
+
+    def _spawn(self, target, stream, name):
+        args = (stream,) if stream is not None else ()
+        thread = threading.Thread(target=target, args=args, name=f"multistream-{name}")
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def wait(self, timeout=None):
+        """Block until every stream has been fully processed or stop() is called"""
+        for thread in list(self._threads):
+            thread.join(timeout)
+        return all(stream.finished for stream in self.streams)
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        with self._frame_ready:
+            self._frame_ready.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        for stream in self.streams:
+            stream.release()
+
+    def stats(self):
+        return [stream.stats() for stream in self.streams]
+
+    def _capture_loop(self, stream):
+        index = 0
+        try:
+            while not self._stop_event.is_set() and not stream.failed:
+                ret, frame = stream.cap.read()
+                if not ret:
+                    break
+                packet = FramePacket(index, time.time(), frame)
+                index += 1
+                stream.frames_read += 1
+
+                if stream.live:
+                    # Replace a frame inference has not picked up yet
+                    try:
+                        stream.input_queue.get_nowait()
+                        stream.frames_dropped += 1
+                    except queue.Empty:
+                        pass
+                    stream.input_queue.put_nowait(packet)
+                else:
+                    while not self._stop_event.is_set() and not stream.failed:
+                        try:
+                            stream.input_queue.put(packet, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+
+                with self._frame_ready:
+                    self._frame_ready.notify()
+        except Exception as e:
+            print(f"Error reading stream {stream.source}: {str(e)}")
+        finally:
+            stream.exhausted = True
+            with self._frame_ready:
+                self._frame_ready.notify()
+
+    def _collect_batch(self):
+        """Round-robin over streams, at most one frame from each per round"""
+        batch = []
+        deadline = None
+        while not self._stop_event.is_set():
+            took_any = False
+            count = len(self.streams)
+            start = self._next_stream
+            for offset in range(count):
+                if len(batch) >= self.batch_size:
+                    break
+                stream = self.streams[(start + offset) % count]
+                if stream.failed:
+                    continue
+                try:
+                    packet = stream.input_queue.get_nowait()
+                except queue.Empty:
+                    continue
+                batch.append((stream, packet))
+                took_any = True
+                self._next_stream = (stream.stream_id + 1) % count
+
+            if len(batch) >= self.batch_size:
+                return batch
+            if batch and deadline is None:
+                deadline = time.monotonic() + self.max_batch_wait
+            if self._all_read():
+                return batch
+            if not took_any:
+                remaining = 0.1 if deadline is None else deadline - time.monotonic()
+                if remaining <= 0:
+                    return batch
+                with self._frame_ready:
+                    self._frame_ready.wait(remaining)
+        return batch
+
+    def _inference_loop(self):
+        try:
+            while not self._stop_event.is_set():
+                batch = self._collect_batch()
+                if not batch:
+                    if self._all_read():
+                        break
+                    continue
+
+                # Regions of every stream are cropped into the same model call
+                detections = detect_regions(self.detector, [packet.frame for _, packet in batch],
+                                            [stream.regions for stream, _ in batch])
+                for (stream, packet), detected_objects in zip(batch, detections):
+                    self._put_output(stream, (packet, detected_objects))
+        except Exception as e:
+            print(f"Error in shared inference: {str(e)}")
+        finally:
+            for stream in self.streams:
+                self._put_output(stream, _END)
+
+    def _all_read(self):
+        return all(stream.failed or (stream.exhausted and stream.input_queue.empty()) for stream in self.streams)
+
+    def _put_output(self, stream, item):
+        # The one inference thread serves every stream, so it must not wait on a stream that
+        # has failed, nor on a slow live one: live results that do not fit are dropped
+        if stream.failed:
+            return
+        if stream.live and item is not _END:
+            try:
+                stream.output_queue.put_nowait(item)
+            except queue.Full:
+                stream.frames_dropped += 1
+            return
+        while not self._stop_event.is_set() and not stream.failed:
+            try:
+                stream.output_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _output_loop(self, stream):
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    item = stream.output_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    break
+
+                packet, detected_objects = item
+                if stream.video_writer is not None or stream.on_frame is not None:
+                    annotated_frame = self.detector.annotate(packet.frame, detected_objects)
+                    if stream.video_writer is not None:
+                        stream.video_writer.write(annotated_frame, len(detected_objects) > 0,
+                                                  packet.timestamp)
+                    if stream.on_frame is not None:
+                        stream.on_frame(stream.stream_id, annotated_frame)
+                if stream.on_detections is not None:
+                    stream.on_detections(stream.stream_id, packet, detected_objects)
+                stream.frames_processed += 1
+        except Exception as e:
+            print(f"Error writing stream {stream.source}: {str(e)}")
+            stream.failed = True
+        finally:
+            # Finalize the output file as soon as this stream is done
+            if stream.video_writer is not None:
+                stream.video_writer.release()
+                stream.video_writer = None
+            stream.finished = True
+            stream.finished_at = time.time()
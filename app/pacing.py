@@ -0,0 +1,71 @@
+import time
+
+
+class FramePacer:
+    """
+    Decides how fast processed frames are released by the pipeline.
+
+    Modes:
+        "fast"   - no pacing, for offline files; frames go out as soon as they are ready.
+        "source" - release frames at the source FPS, sleeping only for whatever is left
+                   of each frame's time slot after decode and inference.
+        "live"   - never wait; the capture stage drops stale frames so the newest
+                   frame is always the one analysed.
+
+    frames_dropped counts frames discarded before inference, frames_late counts
+    frames released after their time slot (source mode) or older than one frame
+    interval when released (live mode).
+    """
+
+    MODES = ("fast", "source", "live")
+
+    def __init__(self, mode="fast", source_fps=0.0, default_fps=30.0):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown pacing mode '{mode}', expected one of {self.MODES}")
+        self.mode = mode
+        # Containers and webcams often report 0 FPS, fall back to a sane rate
+        self.fps = source_fps if source_fps and source_fps > 0 else default_fps
+        self.interval = 1.0 / self.fps
+        self.frames_dropped = 0
+        self.frames_late = 0
+        self._next_due = None
+
+    @property
+    def drops_stale(self):
+        return self.mode == "live"
+
+    def reset(self):
+        """Restart the schedule, e.g. after the stream was paused"""
+        self._next_due = None
+
+    def record_drop(self, count=1):
+        self.frames_dropped += count
+
+    def wait(self, packet):
+        """Block until packet is due for release"""
+        now = time.monotonic()
+        if self.mode == "source":
+            if self._next_due is None:
+                self._next_due = now
+            remaining = self._next_due - now
+            if remaining > 0:
+                time.sleep(remaining)
+                self._next_due += self.interval
+            else:
+                if -remaining > self.interval:
+                    # More than a frame behind: count it and resync instead of bursting to catch up
+                    self.frames_late += 1
+                    self._next_due = now + self.interval
+                else:
+                    self._next_due += self.interval
+        elif self.mode == "live":
+            if time.time() - packet.timestamp > self.interval:
+                self.frames_late += 1
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "fps": self.fps,
+            "frames_dropped": self.frames_dropped,
+            "frames_late": self.frames_late,
+        }
@@ -0,0 +1,201 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+# A frame travelling through the pipeline, tagged with its number in the stream and,
+# when the source knows it, its time in the source in seconds
+FramePacket = namedtuple("FramePacket", ["index", "timestamp", "frame", "position"], defaults=(None,))
+
+# Marks the end of the stream on a stage queue
+_END = object()
+
+
+class FramePipeline:
+    """
+    Capture -> inference -> output pipeline with bounded queues between stages.
+
+    Each stage runs on its own thread so decoding, model inference and
+    encoding/display overlap. Every stage has a single consumer reading a FIFO
+    queue, so frames leave the pipeline in the order they were read. A full
+    queue blocks the stage feeding it, which keeps memory bounded when a
+    downstream stage is slower than the source.
+
+    The inference stage hands frames to process_batch in groups of up to
+    batch_size, waiting at most max_batch_wait seconds for a group to fill
+    before running it with whatever has arrived.
+
+    An optional FramePacer controls release timing at the output stage. When
+    the pacer drops stale frames, the capture queue holds a single frame and
+    a newly read frame replaces one that inference has not picked up yet.
+
+    Packets are numbered in the order frames were read unless frame_index is
+    given, e.g. by a source that skips frames and knows their true numbers;
+    frame_position likewise gives the source time of the frame just read.
+    """
+
+    def __init__(self, read_frame, process_batch, emit_frame, queue_size=4,
+                 batch_size=1, max_batch_wait=0.0, pacer=None, frame_index=None, frame_position=None):
+        self.read_frame = read_frame        # () -> frame, or None at end of stream
+        self.frame_index = frame_index      # () -> number of the frame just read, optional
+        self.frame_position = frame_position  # () -> its time in the source (seconds or None), optional
+        self.process_batch = process_batch  # ([packet, ...]) -> [result, ...]
+        self.emit_frame = emit_frame        # (packet, result) -> None
+        self.batch_size = max(1, batch_size)
+        self.max_batch_wait = max_batch_wait
+        self.pacer = pacer
+        self.drops_stale = pacer is not None and pacer.drops_stale
+        self.capture_queue = queue.Queue(maxsize=1 if self.drops_stale else queue_size)
+        self.output_queue = queue.Queue(maxsize=queue_size)
+        self._paused = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        stages = [
+            ("capture", self._capture_loop),
+            ("inference", self._inference_loop),
+            ("output", self._output_loop),
+        ]
+        for name, target in stages:
+            thread = threading.Thread(target=target, name=f"pipeline-{name}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def pause(self):
+        self._paused.set()
+
+    def resume(self):
+        if self.pacer is not None:
+            self.pacer.reset()
+        self._paused.clear()
+
+    def is_paused(self):
+        return self._paused.is_set()
+
+    def is_running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def wait(self, timeout=None):
+        """Block until every frame has been emitted or the pipeline is stopped"""
+        for thread in self._threads:
+            thread.join(timeout)
+        return not self.is_running()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _put(self, q, item):
+        # Retry with a timeout so a blocked stage still notices stop()
+        while not self._stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _put_latest(self, q, item):
+        # Only the capture stage puts on this queue, so after evicting the
+        # oldest frame there is always room for the new one
+        try:
+            q.put_nowait(item)
+        except queue.Full:
+            try:
+                q.get_nowait()
+                self.pacer.record_drop()
+            except queue.Empty:
+                pass
+            q.put_nowait(item)
+        return True
+
+    def _get(self, q):
+        while not self._stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _capture_loop(self):
+        index = 0
+        try:
+            while not self._stop_event.is_set():
+                if self._paused.is_set():
+                    time.sleep(0.1)
+                    continue
+
+                frame = self.read_frame()
+                if frame is None:
+                    break
+
+                if self.frame_index is not None:
+                    index = self.frame_index()
+                position = self.frame_position() if self.frame_position is not None else None
+                packet = FramePacket(index, time.time(), frame, position)
+                if self.drops_stale:
+                    self._put_latest(self.capture_queue, packet)
+                elif not self._put(self.capture_queue, packet):
+                    return
+                index += 1
+        except Exception as e:
+            print(f"Error in capture stage: {str(e)}")
+        finally:
+            self._put(self.capture_queue, _END)
+
+    def _next_batch(self):
+        """Collect up to batch_size packets; the second value is True at end of stream"""
+        packet = self._get(self.capture_queue)
+        if packet is _END:
+            return [], True
+
+        batch = [packet]
+        deadline = time.monotonic() + self.max_batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    packet = self.capture_queue.get(timeout=remaining)
+                else:
+                    packet = self.capture_queue.get_nowait()
+            except queue.Empty:
+                break
+            if packet is _END:
+                return batch, True
+            batch.append(packet)
+        return batch, False
+
+    def _inference_loop(self):
+        try:
+            finished = False
+            while not finished:
+                batch, finished = self._next_batch()
+                if not batch:
+                    break
+                results = self.process_batch(batch)
+                for packet, result in zip(batch, results):
+                    if not self._put(self.output_queue, (packet, result)):
+                        return
+        except Exception as e:
+            print(f"Error in inference stage: {str(e)}")
+            self._stop_event.set()  # Capture would otherwise block forever on a full queue
+        finally:
+            self._put(self.output_queue, _END)
+
+    def _output_loop(self):
+        try:
+            while True:
+                item = self._get(self.output_queue)
+                if item is _END:
+                    break
+                packet, result = item
+                if self.pacer is not None:
+                    self.pacer.wait(packet)
+                self.emit_frame(packet, result)
+        except Exception as e:
+            print(f"Error in output stage: {str(e)}")
+            self._stop_event.set()  # Unblock the stages feeding this one
@@ -0,0 +1,226 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from metrics import stage_timer
+
+# Default fourcc for each container, used when no codec is given
+CONTAINER_CODECS = {
+    ".mp4": "mp4v",
+    ".m4v": "mp4v",
+    ".mov": "mp4v",
+    ".avi": "MJPG",
+    ".mkv": "XVID",
+}
+RECORD_MODES = ("all", "detections")
+
+# Marks the end of the recording on the queue
+_END = object()
+
+
+def codec_for_path(path, codec=None):
+    """The given codec, or the default one for the file's container"""
+    if codec:
+        return codec
+    return CONTAINER_CODECS.get(os.path.splitext(path)[1].lower(), "mp4v")
+
+
+def segment_path(path, index):
+    """path for the first segment, path with a _001, _002... suffix for later ones"""
+    if index == 0:
+        return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{index:03d}{ext}"
+
+
+class AsyncVideoWriter:
+    """
+    Encodes frames on a background thread so writing never stalls the pipeline.
+
+    write() only puts the frame on a queue bounded by queue_size frames and
+    max_queue_bytes. With block True (video files) a full queue applies
+    backpressure so no frame is lost; with block False (live sources) the
+    frame is dropped and counted instead.
+
+    record="detections" only keeps segments with detections in them: the
+    last pre_roll frames before the first detection are written too, as
+    many of them as fit in pre_roll_bytes, and recording continues for
+    post_roll frames after the last one. Each such
+    segment, and each file that grows past max_bytes, goes to its own file
+    (see segment_path), so paths lists every file written.
+
+    Frames are held uncompressed, so each buffer costs about 6 MB per frame
+    at 1080p and 25 MB at 4K: the byte limits keep a writer under 256 MB by
+    default (e.g. 20 frames of pre-roll at 1080p, 5 at 4K).
+
+    Frame size comes from the first frame. When fps is unknown (None or 0,
+    as many webcams report) it is estimated from the timestamps of the first
+    fps_probe_frames frames, falling back to default_fps.
+    """
+
+    def __init__(self, path, fps=None, codec=None, record="all", pre_roll=30, post_roll=60,
+                 max_bytes=None, queue_size=32, block=True, default_fps=30.0, fps_probe_frames=30,
+                 metrics=None, pre_roll_bytes=128 * 1024 * 1024, max_queue_bytes=128 * 1024 * 1024):
+        if record not in RECORD_MODES:
+            raise ValueError(f"Unknown record mode {record!r}, expected one of {RECORD_MODES}")
+        self.path = path
+        self.fps = fps if fps and 0 < fps <= 240 else None
+        self.codec = codec_for_path(path, codec)
+        self.record = record
+        self.post_roll = post_roll
+        self.max_bytes = max_bytes
+        self.block = block
+        self.default_fps = default_fps
+        self.fps_probe_frames = max(2, fps_probe_frames)
+        self.metrics = metrics
+        self.paths = []
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.pre_roll_bytes = pre_roll_bytes
+        self.max_queue_bytes = max_queue_bytes
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._queued_bytes = 0
+        self._queue_space = threading.Condition()
+        self._pre_roll = deque(maxlen=pre_roll)
+        self._pre_roll_size = 0
+        self._probe = []  # (frame, timestamp) held back until fps is known
+        self._writer = None
+        self._segment_frames = 0
+        self._post_roll_left = 0
+        self._recording = False
+        self._thread = threading.Thread(target=self._run, name="video-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, frame, has_detections=True, timestamp=None):
+        """Queue a frame; the caller must not modify it afterwards"""
+        item = (frame, has_detections, time.time() if timestamp is None else timestamp)
+        with self._queue_space:
+            # A frame larger than the whole budget still goes through once the queue is empty
+            while self._queued_bytes and self._queued_bytes + frame.nbytes > self.max_queue_bytes:
+                if not self.block:
+                    self.frames_dropped += 1
+                    return
+                self._queue_space.wait()
+            self._queued_bytes += frame.nbytes
+        if self.block:
+            self._queue.put(item)
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._dequeued(frame)
+            self.frames_dropped += 1
+
+    def release(self):
+        """Write everything still queued and close the current file"""
+        if self._thread is not None:
+            self._queue.put(_END)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "frames_written": self.frames_written,
+            "frames_dropped": self.frames_dropped,
+            "segments": len(self.paths),
+            "fps": self.fps or 0.0,
+        }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                break
+            self._dequeued(item[0])
+            try:
+                self._handle(*item)
+            except Exception as e:
+                print(f"Error writing video {self.path}: {str(e)}")
+        try:
+            if self._probe:
+                self._flush_probe()
+        except Exception as e:
+            print(f"Error writing video {self.path}: {str(e)}")
+        finally:
+            self._close_segment()
+
+    def _dequeued(self, frame):
+        with self._queue_space:
+            self._queued_bytes -= frame.nbytes
+            self._queue_space.notify_all()
+
+    def _handle(self, frame, has_detections, timestamp):
+        if self.fps is not None:
+            self._record(frame, has_detections)
+            return
+        self._probe.append((frame, has_detections, timestamp))
+        if len(self._probe) >= self.fps_probe_frames:
+            self._flush_probe()
+
+    def _flush_probe(self):
+        first, last = self._probe[0][2], self._probe[-1][2]
+        span = last - first
+        self.fps = (len(self._probe) - 1) / span if span > 0 and len(self._probe) > 1 else self.default_fps
+        probe, self._probe = self._probe, []
+        for frame, has_detections, _ in probe:
+            self._record(frame, has_detections)
+
+    def _record(self, frame, has_detections):
+        if self.record == "all":
+            self._write(frame)
+        elif has_detections:
+            if not self._recording:
+                self._recording = True
+                while self._pre_roll:
+                    self._write(self._pre_roll.popleft())
+                self._pre_roll_size = 0
+            self._write(frame)
+            self._post_roll_left = self.post_roll
+        elif self._recording and self._post_roll_left > 0:
+            self._write(frame)
+            self._post_roll_left -= 1
+        else:
+            if self._recording:
+                # Event over, the next one starts a new file
+                self._recording = False
+                self._close_segment()
+            self._buffer_pre_roll(frame)
+
+    def _buffer_pre_roll(self, frame):
+        if self._pre_roll and len(self._pre_roll) == self._pre_roll.maxlen:
+            self._pre_roll_size -= self._pre_roll[0].nbytes
+        self._pre_roll.append(frame)
+        self._pre_roll_size += frame.nbytes
+        while len(self._pre_roll) > 1 and self._pre_roll_size > self.pre_roll_bytes:
+            self._pre_roll_size -= self._pre_roll.popleft().nbytes
+
+    def _write(self, frame):
+        if self._writer is None:
+            self._open_segment(frame)
+        with stage_timer(self.metrics, "encode"):
+            self._writer.write(frame)
+        self.frames_written += 1
+        self._segment_frames += 1
+        # Checking the file size every frame would mean a stat() per frame
+        if self.max_bytes and self._segment_frames % 30 == 0:
+            if os.path.getsize(self.paths[-1]) >= self.max_bytes:
+                self._close_segment()
+
+    def _open_segment(self, frame):
+        height, width = frame.shape[:2]
+        path = segment_path(self.path, len(self.paths))
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.codec), self.fps, (width, height))
+        if not self._writer.isOpened():
+            print(f"Error: Could not open video writer for {path} with codec {self.codec}")
+        self.paths.append(path)
+        self._segment_frames = 0
+
+    def _close_segment(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
@@ -0,0 +1,155 @@
+import math
+
+import numpy as np
+
+from detections import Detections
+
+
+def parse_roi(text):
+    """(x, y, w, h) from "x,y,w,h"; values are fractions of the frame when all are <= 1, else pixels"""
+    values = [float(value) for value in text.split(",")]
+    if len(values) != 4 or values[2] <= 0 or values[3] <= 0:
+        raise ValueError(f"Expected a region as x,y,w,h with positive size, got {text!r}")
+    return tuple(values)
+
+
+def tile_windows(x1, y1, x2, y2, tile_size, overlap):
+    """Overlapping tile_size squares covering [x1, x2) x [y1, y2), spread evenly"""
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(start, end):
+        length = end - start
+        if length <= tile_size:
+            return [start]
+        count = math.ceil((length - tile_size) / step) + 1
+        return [start + round(i * (length - tile_size) / (count - 1)) for i in range(count)]
+
+    return [(x, y, min(x + tile_size, x2), min(y + tile_size, y2))
+            for y in starts(y1, y2) for x in starts(x1, x2)]
+
+
+def merge_boxes(boxes, confidences, class_ids, window_ids, threshold):
+    """
+    Indices kept by greedy cross-window NMS.
+
+    Boxes are visited by confidence, and a box is only a duplicate of a kept
+    box of the same class from a different window; boxes from one window
+    were already separated by the model's own NMS. Overlap is intersection
+    over the smaller box rather than the union, so the partial box a tile
+    reports for an object cut by its edge matches the box of a window that
+    saw all of it. Of two duplicates the larger box is kept, whichever
+    scored higher.
+    """
+    areas = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    order = np.lexsort((-areas, -confidences))
+    keep = []
+    for i in order:
+        if keep:
+            kept = np.array(keep)
+            top_left = np.maximum(boxes[i, :2], boxes[kept, :2])
+            bottom_right = np.minimum(boxes[i, 2:], boxes[kept, 2:])
+            intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+            overlap = intersection / np.maximum(np.minimum(areas[i], areas[kept]), 1e-9)
+            duplicate = ((overlap >= threshold) & (class_ids[kept] == class_ids[i])
+                         & (window_ids[kept] != window_ids[i]))
+            if duplicate.any():
+                j = np.flatnonzero(duplicate)[0]
+                if areas[i] > areas[kept[j]]:
+                    keep[j] = i
+                continue
+        keep.append(i)
+    return np.array(keep, dtype=np.int64)
+
+
+class FrameRegions:
+    """
+    Runs the model only on regions of interest of a frame, optionally tiled.
+
+    Each ROI is cropped out of the frame and inferred on its own, so the
+    model's input size is spent on the pixels that matter (e.g. the belt in
+    a 4K view). With tile_size set, ROIs larger than a tile are further split
+    into overlapping tile_size squares, so small items keep enough pixels
+    after the model resizes its input; with full_region the whole ROI is
+    inferred as well, so objects larger than a tile are still found whole.
+    All crops of a batch of frames go to the model in one call, and their
+    detections are moved back to full-frame coordinates and merged across
+    windows (see merge_boxes).
+
+    Without rois the whole frame is the region.
+    """
+
+    def __init__(self, rois=None, tile_size=None, overlap=0.2, full_region=True, merge_threshold=0.6):
+        self.rois = list(rois or [])  # (x, y, w, h), fractions of the frame or pixels
+        self.tile_size = tile_size
+        self.overlap = overlap  # Fraction of a tile shared with its neighbour
+        self.full_region = full_region
+        self.merge_threshold = merge_threshold
+        self._windows = {}  # (width, height) -> [(x1, y1, x2, y2), ...]
+
+    def windows(self, width, height):
+        """Crop windows in pixels for a frame of this size"""
+        windows = self._windows.get((width, height))
+        if windows is not None:
+            return windows
+        windows = []
+        for x, y, w, h in self.rois or [(0.0, 0.0, 1.0, 1.0)]:
+            if max(x, y, w, h) <= 1:
+                x, y, w, h = x * width, y * height, w * width, h * height
+            x1, y1 = max(0, int(x)), max(0, int(y))
+            x2, y2 = min(width, int(round(x + w))), min(height, int(round(y + h)))
+            if x2 <= x1 or y2 <= y1:
+                continue  # Region lies outside this frame
+            tiles = tile_windows(x1, y1, x2, y2, self.tile_size, self.overlap) if self.tile_size else []
+            if len(tiles) > 1:
+                windows.extend(tiles)
+            if len(tiles) <= 1 or self.full_region:
+                windows.append((x1, y1, x2, y2))
+        self._windows[(width, height)] = windows
+        return windows
+
+    def crops(self, frame):
+        """(crops, windows) to infer for one frame; crops are views into frame"""
+        windows = self.windows(frame.shape[1], frame.shape[0])
+        return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in windows], windows
+
+    def merge(self, detections, windows, empty):
+        """One frame's Detections from the detections of its windows"""
+        parts = [(i, found, window) for i, (found, window) in enumerate(zip(detections, windows)) if len(found)]
+        if not parts:
+            return empty
+        boxes = np.concatenate([found.boxes + np.array([x1, y1, x1, y1], dtype=np.float32)
+                                for _, found, (x1, y1, _, _) in parts])
+        confidences = np.concatenate([found.confidences for _, found, _ in parts])
+        class_ids = np.concatenate([found.class_ids for _, found, _ in parts])
+        if len(parts) > 1:
+            window_ids = np.concatenate([np.full(len(found), i) for i, found, _ in parts])
+            keep = merge_boxes(boxes, confidences, class_ids, window_ids, self.merge_threshold)
+            boxes, confidences, class_ids = boxes[keep], confidences[keep], class_ids[keep]
+        return Detections(boxes, confidences, class_ids, empty.class_lookup, empty.category_lookup)
+
+    def detect_batch(self, detector, frames, cached=False):
+        return detect_regions(detector, frames, [self] * len(frames), cached)
+
+
+def detect_regions(detector, frames, regions, cached=False):
+    """Detections per frame, inferring only regions[i] of frames[i] (None for the whole frame)"""
+    crops = []
+    spans = []  # (first crop, windows) per frame
+    for frame, frame_regions in zip(frames, regions):
+        if frame_regions is None or frame is None:
+            spans.append((len(crops), None))
+            crops.append(frame)
+            continue
+        frame_crops, windows = frame_regions.crops(frame)
+        spans.append((len(crops), windows))
+        crops.extend(frame_crops)
+
+    detected = detector.detect_batch(crops, cached) if crops else []
+    outputs = []
+    for frame_regions, (first, windows) in zip(regions, spans):
+        if windows is None:
+            outputs.append(detected[first])
+        else:
+            outputs.append(frame_regions.merge(detected[first:first + len(windows)], windows,
+                                               detector.no_detections))
+    return outputs
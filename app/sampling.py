@@ -0,0 +1,86 @@
+import cv2
+
+
+class VideoSampler:
+    """
+    Reads every stride-th frame of a video file, or one frame every interval seconds.
+
+    Skipped frames are advanced over with grab(), which demuxes them without
+    converting them to BGR images. When the next sampled frame is at least
+    seek_threshold frames away it is cheaper to seek there instead, since
+    the decoder restarts from the nearest keyframe rather than working
+    through every frame in between.
+
+    read() returns the sampled frame; index and position then hold its true
+    frame number and time (seconds) in the file. Nothing is interpolated,
+    frames that were not sampled simply have no results.
+    """
+
+    def __init__(self, cap, stride=1, interval=None, seek_threshold=60):
+        self.cap = cap
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.stride = max(1, stride)
+        self.interval = interval  # Seconds between samples, takes precedence over stride
+        self.seek_threshold = seek_threshold
+        self.index = -1  # Frame number of the last sampled frame
+        self.position = None  # Its time in seconds
+        self.frames_sampled = 0
+        self.frames_skipped = 0
+        self.seeks = 0
+        self._next = 0  # Frame number the decoder returns on the next read()
+        self._samples = 0
+
+    @property
+    def step(self):
+        """Average source frames per sampled frame"""
+        if self.interval is not None and self.fps > 0:
+            return max(1.0, self.interval * self.fps)
+        return float(self.stride)
+
+    def _target(self):
+        if self.interval is None:
+            return self._samples * self.stride
+        if self.fps > 0:
+            # From the sample count rather than adding a rounded step, so it never drifts
+            return max(self.index + 1, round(self._samples * self.interval * self.fps))
+        return None  # Unknown frame rate, seek by time instead
+
+    def read(self):
+        target = self._target()
+        if target is None:
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, self._samples * self.interval * 1000.0)
+            ret, frame = self.cap.read()
+            if not ret:
+                return None
+            self.index = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+            self.position = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            self.seeks += 1
+        else:
+            if self.frame_count > 0 and target >= self.frame_count:
+                return None
+            gap = target - self._next
+            if gap >= self.seek_threshold:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                self.seeks += 1
+            else:
+                for _ in range(gap):
+                    if not self.cap.grab():
+                        return None
+            self.frames_skipped += gap
+            ret, frame = self.cap.read()
+            if not ret:
+                return None
+            self.index = target
+            self.position = target / self.fps if self.fps > 0 else None
+            self._next = target + 1
+        self._samples += 1
+        self.frames_sampled += 1
+        return frame
+
+    def stats(self):
+        return {
+            "frames_sampled": self.frames_sampled,
+            "frames_skipped": self.frames_skipped,
+            "seeks": self.seeks,
+        }
@@ -0,0 +1,276 @@
+import asyncio
+import base64
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from metrics import Metrics
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error",
+               503: "Service Unavailable"}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def decode_image(data):
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise RequestError(400, "Could not decode image")
+    return frame
+
+
+class InferenceServer:
+    """
+    Local HTTP/1.1 detection service built on asyncio streams.
+
+    Endpoints:
+      POST /detect        body is one encoded image (JPEG/PNG...)
+      POST /detect_batch  body is {"images": [base64 encoded image, ...]}
+      GET  /health        model and queue state
+      GET  /metrics       Prometheus text format
+
+    Frames from all concurrent requests go into one queue. A single batcher
+    task takes up to max_batch_size of them, waiting at most max_delay
+    seconds after the first for the batch to fill, and runs them through the
+    one loaded detector on an inference thread. Image decoding happens on a
+    separate thread pool so the event loop only moves bytes. When
+    max_queue frames are already waiting, new requests are rejected with 503
+    and Retry-After, before their images are decoded, instead of queueing
+    unbounded latency; a batch larger than max_queue gets 413.
+    """
+
+    def __init__(self, detector, host="127.0.0.1", port=8080, max_batch_size=8, max_delay=0.01,
+                 max_queue=64, max_body_bytes=32 * 1024 * 1024, decode_workers=4, metrics=None):
+        self.detector = detector
+        self.host = host
+        self.port = port
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.max_body_bytes = max_body_bytes
+        self.metrics = metrics or Metrics()
+        if detector.metrics is None:
+            detector.metrics = self.metrics
+        self.metrics.add_collector("server", self.stats)
+        self._decode_pool = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+        self._inference_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._queue = None
+        self._queued = 0  # Frames admitted but not yet inferred
+        self._server = None
+        self._batcher = None
+        self.ready = None  # asyncio.Event, set once the socket is listening
+
+    def stats(self):
+        return {"queued_frames": self._queued, "max_queue": self.max_queue}
+
+    async def serve(self):
+        self._queue = asyncio.Queue()
+        self.ready = asyncio.Event()
+        self._batcher = asyncio.ensure_future(self._batch_loop())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"Serving detections on http://{self.host}:{self.port}")
+        self.ready.set()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            self._batcher.cancel()
+            self._decode_pool.shutdown(wait=False)
+            self._inference_pool.shutdown(wait=True)
+
+    def run(self):
+        """Serve until interrupted"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Stopping server")
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            frames = [frame for frame, _, _ in batch]
+            now = time.perf_counter()
+            for _, _, queued_at in batch:
+                self.metrics.observe("queue_wait", now - queued_at)
+            self.metrics.increment("batches")
+            self.metrics.increment("batched_frames", len(batch))
+            try:
+                results = await loop.run_in_executor(self._inference_pool, self.detector.detect_batch, frames)
+            except Exception as e:
+                results = [e] * len(batch)
+            self._queued -= len(batch)
+            for (_, future, _), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _admit(self, count):
+        """Reserve queue room for count frames before any of them is decoded"""
+        if count > self.max_queue:
+            raise RequestError(413, f"At most {self.max_queue} images per request")
+        if self._queued + count > self.max_queue:
+            self.metrics.increment("rejected")
+            raise RequestError(503, "Too many queued frames, retry later")
+        self._queued += count
+
+    async def _detect(self, frames):
+        """Queue admitted frames for the batcher and wait for their Detections"""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for frame in frames:
+            future = loop.create_future()
+            futures.append(future)
+            self._queue.put_nowait((frame, future, time.perf_counter()))
+        return await asyncio.gather(*futures)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                if not request_line:
+                    break
+                keep_alive = await self._handle_request(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away mid-request
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request_line, reader, writer):
+        start = time.perf_counter()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            method, path, version = request_line.decode("latin-1").split()
+        except ValueError:
+            self._respond(writer, 400, {"error": "Malformed request line"}, keep_alive=False)
+            return False
+        keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+        path = path.split("?")[0]
+
+        body = b""
+        if "content-length" in headers:
+            try:
+                length = int(headers["content-length"])
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._respond(writer, 400, {"error": "Invalid Content-Length"}, keep_alive=False)
+                return False
+            if length > self.max_body_bytes:
+                self._respond(writer, 413, {"error": f"Body larger than {self.max_body_bytes} bytes"},
+                              keep_alive=False)
+                return False
+            body = await reader.readexactly(length)
+        elif "transfer-encoding" in headers:
+            keep_alive = False  # Chunked bodies are not read, the rest would look like the next request
+
+        try:
+            status, payload = await self._route(method, path, headers, body)
+        except RequestError as e:
+            status, payload = e.status, {"error": str(e)}
+        except Exception as e:
+            print(f"Error handling {method} {path}: {str(e)}")
+            status, payload = 500, {"error": str(e)}
+
+        self._respond(writer, status, payload, keep_alive)
+        self.metrics.increment("requests")
+        self.metrics.increment(f"responses_{status}")
+        self.metrics.observe("request", time.perf_counter() - start)
+        return keep_alive
+
+    async def _route(self, method, path, headers, body):
+        if path == "/health":
+            if not self.detector.ready.is_set():
+                status = "loading"
+            else:
+                status = "ok" if self.detector.load_error is None else "error"
+            return (200 if status == "ok" else 503), {
+                "status": status,
+                "model": self.detector.model_path,
+                "backend": getattr(self.detector, "backend", None),
+                "queued_frames": self._queued,
+                "max_batch_size": self.max_batch_size,
+            }
+        if path == "/metrics":
+            return 200, self.metrics.to_prometheus()
+        if path not in ("/detect", "/detect_batch"):
+            raise RequestError(404, f"No such endpoint {path}")
+        if method != "POST":
+            raise RequestError(405, f"{path} only accepts POST")
+        if "content-length" not in headers:
+            raise RequestError(411, "Content-Length is required")
+        if not self.detector.wait_ready(0):
+            raise RequestError(503, "Model is not loaded")
+
+        if path == "/detect":
+            encoded = [body]
+        else:
+            try:
+                images = json.loads(body)["images"]
+                encoded = [base64.b64decode(image) for image in images]
+            except (ValueError, KeyError, TypeError):
+                raise RequestError(400, 'Expected {"images": [base64 encoded image, ...]}')
+            if not encoded:
+                raise RequestError(400, "No images in the batch")
+
+        # Admission comes first so shed load does not cost a decode
+        self._admit(len(encoded))
+        loop = asyncio.get_running_loop()
+        try:
+            frames = await asyncio.gather(*[loop.run_in_executor(self._decode_pool, decode_image, data)
+                                            for data in encoded])
+        except BaseException:
+            self._queued -= len(encoded)
+            raise
+        results = await self._detect(frames)
+        items = [{"width": frame.shape[1], "height": frame.shape[0], "detections": detections.to_dicts()}
+                 for frame, detections in zip(frames, results)]
+        return 200, items[0] if path == "/detect" else {"results": items}
+
+    def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode(), "application/json"
+        head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
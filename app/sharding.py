@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from detector import YOLODetector
+from recorder import codec_for_path
+from utils import save_video_writer
+
+# Intermediate segments use Motion JPEG so stitching does not compound mp4v artifacts
+SEGMENT_CODEC = "MJPG"
+SEGMENT_EXTENSION = ".avi"
+
+
+def plan_segments(frame_count, shards, min_frames=30):
+    """
+    Split [0, frame_count) into up to `shards` contiguous (start, end) frame ranges.
+
+    The last range ends at None so frames beyond an inaccurate container
+    frame count are still processed.
+    """
+    if frame_count <= 0:
+        return [(0, None)]
+    shards = max(1, min(shards, frame_count // max(1, min_frames)))
+    size = -(-frame_count // shards)  # ceil division
+    segments = [(start, min(start + size, frame_count)) for start in range(0, frame_count, size)]
+    segments[-1] = (segments[-1][0], None)
+    return segments
+
+
+def _process_segment(video_path, start, end, segment_path, model_path, confidence, batch_size,
+                     detector_options=None, regions=None):
+    """Worker process entry point: detect and annotate frames [start, end) of the video
+
+    With segment_path None frames are only detected, not annotated or written.
+    """
+    detector = YOLODetector(model_path, **(detector_options or {}))
+    detector.confidence_threshold = confidence
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video file {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    writer = None
+    if segment_path is not None:
+        writer = save_video_writer(segment_path, fps, width, height, codec=SEGMENT_CODEC)
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    detections = []
+    position = start
+    try:
+        while end is None or position < end:
+            frames = []
+            while len(frames) < batch_size and (end is None or position + len(frames) < end):
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+            if not frames:
+                break
+
+            if regions is not None:
+                detected = regions.detect_batch(detector, frames)
+            else:
+                detected = detector.detect_batch(frames)
+            for frame, detected_objects in zip(frames, detected):
+                if writer is not None:
+                    writer.write(detector.annotate(frame, detected_objects))
+                detections.append(detected_objects)
+            position += len(frames)
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+
+    return start, detections
+
+
+def _stitch_segments(segment_paths, output_path, fps, width, height, codec=None):
+    writer = save_video_writer(output_path, fps, width, height, codec=codec_for_path(output_path, codec))
+    try:
+        for path in segment_paths:
+            cap = cv2.VideoCapture(path)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                writer.write(frame)
+            cap.release()
+    finally:
+        writer.release()
+
+
+def process_video_sharded(video_path, output_path, model_path="waste_classification_model.pt",
+                          confidence=0.6, workers=None, batch_size=4, codec=None, detector_options=None,
+                          regions=None):
+    """
+    Process one video in parallel frame-range segments, one process per segment.
+
+    Every worker loads its own YOLODetector, so Python post-processing runs on
+    all cores instead of contending for one GIL. The annotated segments are
+    stitched back in order into output_path, or skipped entirely when
+    output_path is None. Returns the per-frame detections for the whole video,
+    indexed by frame number. regions (FrameRegions) limits inference to ROIs/tiles.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Error: Could not open video file {video_path}")
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    workers = workers or os.cpu_count() or 1
+    segments = plan_segments(frame_count, workers)
+    if output_path is not None:
+        temp_dir = tempfile.mkdtemp(prefix="segments_", dir=os.path.dirname(os.path.abspath(output_path)))
+        segment_paths = [os.path.join(temp_dir, f"segment_{i:04d}{SEGMENT_EXTENSION}") for i in range(len(segments))]
+    else:
+        temp_dir = None
+        segment_paths = [None] * len(segments)
+
+    try:
+        # Spawn fresh interpreters so workers do not inherit model or OpenCV thread state
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(segments)), mp_context=context) as pool:
+            futures = [
+                pool.submit(_process_segment, video_path, start, end, segment_path,
+                            model_path, confidence, batch_size, detector_options, regions)
+                for (start, end), segment_path in zip(segments, segment_paths)
+            ]
+            results = sorted((future.result() for future in futures), key=lambda result: result[0])
+
+        if output_path is not None:
+            _stitch_segments(segment_paths, output_path, fps, width, height, codec)
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    detections = []
+    for _, segment_detections in results:
+        detections.extend(segment_detections)
+    return detections
@@ -0,0 +1,58 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """Records how long each startup phase took, relative to process start"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases = []  # (name, seconds, finished_at seconds since start)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Add a phase measured elsewhere, e.g. on a background thread"""
+        with self._lock:
+            self.phases.append((name, seconds, time.perf_counter() - self.started_at))
+
+    def report(self):
+        with self._lock:
+            lines = [f"  {name:<20} {seconds * 1000:8.1f} ms (done at {finished * 1000:.0f} ms)"
+                     for name, seconds, finished in self.phases]
+        print("Startup timings:\n" + "\n".join(lines))
+
+
+class FlushTimer:
+    """Calls flush every interval seconds on a daemon thread until stopped"""
+
+    def __init__(self, flush, interval, name="flush-timer"):
+        self.flush = flush
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing buffered records: {str(e)}")
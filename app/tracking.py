@@ -0,0 +1,206 @@
+from collections import Counter
+
+import numpy as np
+
+from detections import Detections
+
+
+def box_iou(a, b):
+    """(N, 4) x (M, 4) IoU matrix of x1, y1, x2, y2 boxes"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+class Track:
+    """
+    One tracked object: a constant-velocity Kalman filter over the box centre and size.
+
+    State is cx, cy, w, h and their per-frame velocities; only the box is
+    measured. The filter matrices are shared by all tracks (see ObjectTracker).
+    """
+
+    def __init__(self, track_id, box, confidence, class_id, covariance):
+        x1, y1, x2, y2 = box
+        self.track_id = track_id
+        self.state = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0, 0, 0, 0], dtype=np.float64)
+        self.covariance = covariance.copy()
+        self.confidence = float(confidence)
+        self.class_id = int(class_id)
+        self.hits = 1  # Keyframes the track was detected in
+        self.missed = 0  # Keyframes in a row it was not
+        self.counted = False
+
+    @property
+    def box(self):
+        cx, cy, w, h = self.state[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dtype=np.float32)
+
+    def uncertainty(self):
+        """Position standard deviation relative to the box size"""
+        w, h = np.maximum(self.state[2:4], 1.0)
+        return float(np.sqrt(self.covariance[0, 0] + self.covariance[1, 1]) / np.sqrt(w * h))
+
+
+class ObjectTracker:
+    """
+    IoU-matched Kalman tracker so the detector only runs on keyframes.
+
+    update(detections) is called with detector output on keyframes: tracks
+    are predicted forward, matched greedily to same-class detections by IoU,
+    corrected, and unmatched detections start new tracks. predict() is called
+    on the frames in between and moves every visible track along its velocity
+    instead of running the model. needs_detection() says when the next frame
+    should be a keyframe: every keyframe_interval frames, while a new track
+    is still unconfirmed, or when a track's predicted position has become too
+    uncertain (max_uncertainty, relative to its size).
+
+    Both return Detections with track_ids, and each track that was detected
+    in min_hits keyframes is counted once per waste category in
+    unique_counts, so an item that stays in view is not counted again.
+    """
+
+    def __init__(self, keyframe_interval=5, iou_threshold=0.3, max_missed=3, min_hits=2,
+                 max_uncertainty=0.25):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed  # Keyframes a lost track is kept for re-association
+        self.min_hits = min_hits
+        self.max_uncertainty = max_uncertainty
+
+        # Constant-velocity model, one frame per step
+        self.transition = np.eye(8)
+        self.transition[:4, 4:] = np.eye(4)
+        self.measurement = np.eye(4, 8)
+        self.process_noise = np.diag([1.0, 1.0, 1.0, 1.0, 0.5, 0.5, 0.25, 0.25])
+        self.measurement_noise = np.diag([4.0, 4.0, 9.0, 9.0])
+        self.initial_covariance = np.diag([10.0, 10.0, 10.0, 10.0, 100.0, 100.0, 100.0, 100.0])
+        self.reset()
+
+    def reset(self):
+        self.tracks = []
+        self.next_id = 1
+        self.frames_since_keyframe = None  # None until the first keyframe
+        self.unique_counts = Counter()  # waste category -> confirmed tracks
+        self.keyframes = 0
+        self.frames_tracked = 0
+        self.class_names = None
+        self.category_lookup = None
+
+    def needs_detection(self):
+        if self.frames_since_keyframe is None or self.frames_since_keyframe + 1 >= self.keyframe_interval:
+            return True
+        for track in self.tracks:
+            if track.missed == 0 and (track.hits < self.min_hits or track.uncertainty() > self.max_uncertainty):
+                return True
+        return False
+
+    def plan(self, count):
+        """Indices of the next count frames that will be keyframes by interval alone"""
+        if self.frames_since_keyframe is None:
+            first = 0
+        else:
+            first = max(0, self.keyframe_interval - self.frames_since_keyframe - 1)
+        return list(range(first, count, self.keyframe_interval))
+
+    def update(self, detections):
+        """Correct the tracks with a keyframe's detections; returns them with track ids"""
+        self.class_names = detections.class_lookup
+        self.category_lookup = detections.category_lookup
+        self.frames_since_keyframe = 0
+        self.keyframes += 1
+        for track in self.tracks:
+            self._predict(track)
+
+        track_ids = np.zeros(len(detections), dtype=np.int64)
+        matched_tracks = set()
+        matched_detections = set()
+        if self.tracks and len(detections):
+            ious = box_iou(np.array([track.box for track in self.tracks]), detections.boxes)
+            track_classes = np.array([track.class_id for track in self.tracks])
+            ious[track_classes[:, None] != detections.class_ids[None, :]] = 0.0
+            while True:
+                t, d = np.unravel_index(np.argmax(ious), ious.shape)
+                if ious[t, d] < self.iou_threshold:
+                    break
+                self._correct(self.tracks[t], detections.boxes[d], detections.confidences[d])
+                track_ids[d] = self.tracks[t].track_id
+                matched_tracks.add(t)
+                matched_detections.add(d)
+                ious[t, :] = 0.0
+                ious[:, d] = 0.0
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for d in range(len(detections)):
+            if d not in matched_detections:
+                track = Track(self.next_id, detections.boxes[d], detections.confidences[d],
+                              detections.class_ids[d], self.initial_covariance)
+                self.next_id += 1
+                self.tracks.append(track)
+                track_ids[d] = track.track_id
+
+        confirmed = [track for track in self.tracks if not track.counted and track.hits >= self.min_hits]
+        if confirmed:
+            # Replaced rather than modified, so other threads can read it without a lock
+            counts = Counter(self.unique_counts)
+            for track in confirmed:
+                track.counted = True
+                counts[self.category_lookup[track.class_id]] += 1
+            self.unique_counts = counts
+
+        return Detections(detections.boxes, detections.confidences, detections.class_ids,
+                          detections.class_lookup, detections.category_lookup, track_ids)
+
+    def predict(self):
+        """Propagate the visible tracks one frame without running the detector"""
+        self.frames_tracked += 1
+        if self.frames_since_keyframe is not None:
+            self.frames_since_keyframe += 1
+        visible = [track for track in self.tracks if track.missed == 0]
+        for track in self.tracks:
+            self._predict(track)
+        if self.class_names is None:
+            return None
+        if not visible:
+            return Detections(np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                              np.zeros(0, dtype=np.int32), self.class_names, self.category_lookup,
+                              np.zeros(0, dtype=np.int64))
+        return Detections(np.array([track.box for track in visible]),
+                          np.array([track.confidence for track in visible], dtype=np.float32),
+                          np.array([track.class_id for track in visible], dtype=np.int32),
+                          self.class_names, self.category_lookup,
+                          np.array([track.track_id for track in visible], dtype=np.int64))
+
+    def stats(self):
+        frames = self.keyframes + self.frames_tracked
+        return {
+            "keyframes": self.keyframes,
+            "frames_tracked": self.frames_tracked,
+            "keyframe_ratio": self.keyframes / frames if frames else 0.0,
+            "active_tracks": sum(1 for track in self.tracks if track.missed == 0),
+            "unique_items": sum(self.unique_counts.values()),
+        }
+
+    def _predict(self, track):
+        track.state = self.transition @ track.state
+        track.state[2:4] = np.maximum(track.state[2:4], 1.0)
+        track.covariance = self.transition @ track.covariance @ self.transition.T + self.process_noise
+
+    def _correct(self, track, box, confidence):
+        x1, y1, x2, y2 = box
+        measured = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1])
+        innovation = measured - self.measurement @ track.state
+        innovation_covariance = self.measurement @ track.covariance @ self.measurement.T + self.measurement_noise
+        gain = track.covariance @ self.measurement.T @ np.linalg.inv(innovation_covariance)
+        track.state = track.state + gain @ innovation
+        track.covariance = (np.eye(8) - gain @ self.measurement) @ track.covariance
+        track.confidence = float(confidence)
+        track.hits += 1
+        track.missed = 0
@@ -1,13 +1,15 @@
 import cv2
 import datetime
+import threading
+import time
 import numpy as np
 
-def resize_for_display(frame, width=800, height=480):
+def letterbox_geometry(frame_width, frame_height, width, height):
     """
-    Resize frame for display while maintaining aspect ratio
+    Size and offset of a frame scaled to fit width x height, keeping its aspect ratio.
+    Returns (new_width, new_height, x_offset, y_offset).
     """
-    h, w = frame.shape[:2]
-    aspect = w / h
+    aspect = frame_width / frame_height
     
     if aspect > width / height:
         # Width is the limiting factor
@@ -18,25 +20,132 @@ def resize_for_display(frame, width=800, height=480):
         new_height = height
         new_width = int(height * aspect)
     
+    # Calculate position to paste the resized image
+    y_offset = (height - new_height) // 2
+    x_offset = (width - new_width) // 2
+    return new_width, new_height, x_offset, y_offset
+
+def resize_for_display(frame, width=800, height=480):
+    """
+    Resize frame for display while maintaining aspect ratio
+    """
+    h, w = frame.shape[:2]
+    new_width, new_height, x_offset, y_offset = letterbox_geometry(w, h, width, height)
+    
     resized = cv2.resize(frame, (new_width, new_height))
     
     # Create a black canvas of the desired size
     canvas = np.zeros((height, width, 3), dtype=np.uint8)
     
-    # Calculate position to paste the resized image
-    y_offset = (height - new_height) // 2
-    x_offset = (width - new_width) // 2
-    
     # Paste the resized image onto the canvas
     canvas[y_offset:y_offset+new_height, x_offset:x_offset+new_width] = resized
     
     return canvas
 
-def save_image(frame):
-    path = f"yolo_image_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+class DisplaySurface:
+    """
+    Reusable letterboxed display buffer, the allocation-free version of resize_for_display.
+
+    The canvas and the intermediate resized image are allocated once per input
+    resolution. Each render resizes into the preallocated buffer and converts
+    color from there straight into the canvas slice, so the color conversion
+    runs on the small image and nothing is allocated per frame. The returned
+    canvas is overwritten by the next render.
+    """
+
+    def __init__(self, width=800, height=480):
+        self.width = width
+        self.height = height
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self._input_size = None
+        self._scaled = None
+        self._target = None
+
+    def _configure(self, frame_width, frame_height):
+        new_width, new_height, x_offset, y_offset = letterbox_geometry(
+            frame_width, frame_height, self.width, self.height)
+        self.canvas[:] = 0  # Borders stay black from here on
+        self._scaled = np.empty((new_height, new_width, 3), dtype=np.uint8)
+        self._target = self.canvas[y_offset:y_offset+new_height, x_offset:x_offset+new_width]
+        self._input_size = (frame_width, frame_height)
+
+    def render(self, frame, color_conversion=cv2.COLOR_BGR2RGB):
+        h, w = frame.shape[:2]
+        if self._input_size != (w, h):
+            self._configure(w, h)
+        
+        cv2.resize(frame, (self._scaled.shape[1], self._scaled.shape[0]), dst=self._scaled)
+        if color_conversion is None:
+            self._target[...] = self._scaled
+        else:
+            cv2.cvtColor(self._scaled, color_conversion, dst=self._target)
+        return self.canvas
+
+# BGR colors cycled by class id when drawing detections
+BOX_COLORS = [
+    (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+    (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0),
+    (168, 153, 44), (255, 194, 0), (147, 69, 52), (255, 115, 100), (236, 24, 0),
+    (255, 56, 132), (133, 0, 82), (255, 56, 203),
+]
+
+def draw_detections(frame, detections, line_width=2, font_scale=0.5):
+    """
+    Draw boxes and "class confidence" labels directly onto frame (no copy)
+    """
+    boxes = detections.boxes.astype(int).tolist()
+    labels = [f"{name} {confidence:.2f}" for name, confidence in
+              zip(detections.class_names, detections.confidences.tolist())]
+    
+    for (x1, y1, x2, y2), label, class_id in zip(boxes, labels, detections.class_ids.tolist()):
+        color = BOX_COLORS[class_id % len(BOX_COLORS)]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, line_width)
+        
+        # Filled label background above the box, or inside it at the top edge
+        (text_w, text_h), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+        label_y = y1 if y1 - text_h - baseline >= 0 else y1 + text_h + baseline
+        cv2.rectangle(frame, (x1, label_y - text_h - baseline), (x1 + text_w, label_y), color, -1)
+        cv2.putText(frame, label, (x1, label_y - baseline), cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale, (255, 255, 255), 1, cv2.LINE_AA)
+    
+    return frame
+
+def save_image(frame, path=None):
+    if path is None:
+        path = f"yolo_image_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
     cv2.imwrite(path, frame)
     return path
 
-def save_video_writer(path, fps=30, width=800, height=500):
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+def save_video_writer(path, fps=30, width=800, height=500, codec='mp4v'):
+    fourcc = cv2.VideoWriter_fourcc(*codec)
     return cv2.VideoWriter(path, fourcc, fps, (width, height))
+
+def probe_cameras(indices=range(5), timeout=3.0):
+    """
+    Return the camera indices that deliver a frame, probing all of them in parallel.
+
+    Each index is opened on its own daemon thread; indices that have not
+    answered within timeout seconds are treated as missing, so a device that
+    hangs in open() or read() cannot stall the caller.
+    """
+    found = {}
+
+    def probe(index):
+        cap = cv2.VideoCapture(index)
+        try:
+            if cap.read()[0]:
+                found[index] = True
+        finally:
+            cap.release()
+
+    threads = []
+    for index in indices:
+        thread = threading.Thread(target=probe, args=(index,), name=f"camera-probe-{index}")
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    return [str(index) for index in indices if found.get(index)]
@@ -0,0 +1,175 @@
+"""
+Parity and speed check of the ONNX Runtime / OpenVINO backends against PyTorch.
+
+Every backend runs the same frames through YOLODetector. Its detections are
+matched to the PyTorch ones per frame (same class, IoU >= --match-iou) and
+the script reports FPS, latency percentiles, recall/precision of the
+matches, mean IoU and the largest confidence difference. It exits non-zero
+when a backend misses the --min-recall / --min-precision targets:
+
+    python benchmarks/bench_backends.py --model waste_classification_model.pt --video clip.mp4
+    python benchmarks/bench_backends.py --model waste_classification_model.pt --int8 --calibration-dir calib/
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from backends import BACKENDS  # noqa: E402
+from bench_pipeline import git_commit, load_frames, make_synthetic_clip, peak_rss_mb, percentiles  # noqa: E402
+from detector import YOLODetector  # noqa: E402
+from tracking import box_iou  # noqa: E402
+
+
+def match(reference, candidate, min_iou):
+    """Greedy same-class matching; returns [(iou, confidence difference)] per matched pair"""
+    if not len(reference) or not len(candidate):
+        return []
+    ious = box_iou(reference.boxes, candidate.boxes)
+    ious[reference.class_ids[:, None] != candidate.class_ids[None, :]] = 0.0
+    pairs = []
+    while True:
+        i, j = np.unravel_index(np.argmax(ious), ious.shape)
+        if ious[i, j] < min_iou:
+            return pairs
+        pairs.append((float(ious[i, j]), abs(float(reference.confidences[i] - candidate.confidences[j]))))
+        ious[i, :] = 0.0
+        ious[:, j] = 0.0
+
+
+def run_backend(detector, frames, repeat, batch_size):
+    detector.detect_batch(frames[:batch_size])  # Warm-up
+    samples = []
+    outputs = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        outputs = []
+        for i in range(0, len(frames), batch_size):
+            t0 = time.perf_counter()
+            outputs.extend(detector.detect_batch(frames[i:i + batch_size]))
+            samples.append((time.perf_counter() - t0) / len(frames[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    return outputs, {
+        "fps": len(frames) * repeat / elapsed if elapsed > 0 else 0.0,
+        "latency_per_frame": percentiles(samples),
+    }
+
+
+def parity(reference, candidate, min_iou):
+    pairs = []
+    reference_count = candidate_count = 0
+    for expected, actual in zip(reference, candidate):
+        reference_count += len(expected)
+        candidate_count += len(actual)
+        pairs.extend(match(expected, actual, min_iou))
+    return {
+        "reference_detections": reference_count,
+        "detections": candidate_count,
+        "recall": len(pairs) / reference_count if reference_count else 1.0,
+        "precision": len(pairs) / candidate_count if candidate_count else 1.0,
+        "mean_iou": float(np.mean([iou for iou, _ in pairs])) if pairs else None,
+        "max_confidence_diff": max((diff for _, diff in pairs), default=None),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare inference backends with the PyTorch model")
+    parser.add_argument("--model", required=True, help="YOLO .pt model to export and compare")
+    parser.add_argument("--backends", default="onnx,openvino", help="Comma separated backends to check")
+    parser.add_argument("--int8", action="store_true", help="Also check INT8 versions of the backends")
+    parser.add_argument("--calibration-dir", help="Calibration images for --int8")
+    parser.add_argument("--threads", type=int, help="Inference threads for every backend")
+    parser.add_argument("--video", help="Recorded clip to use instead of a synthetic one")
+    parser.add_argument("--frames", type=int, default=60, help="Frames compared")
+    parser.add_argument("--repeat", type=int, default=2, help="Timed passes over the frames")
+    parser.add_argument("--batch-size", type=int, default=1, help="Frames per model call")
+    parser.add_argument("--confidence", type=float, default=0.25, help="Confidence threshold")
+    parser.add_argument("--match-iou", type=float, default=0.5, help="IoU for two detections to match")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="Fail below this FP32 recall")
+    parser.add_argument("--min-precision", type=float, default=0.95, help="Fail below this FP32 precision")
+    parser.add_argument("--output", default="bench_results_backends.json", help="Where the JSON results are written")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video_path = args.video
+        if video_path is None:
+            video_path = os.path.join(temp_dir, "synthetic.mp4")
+            make_synthetic_clip(video_path, args.frames, 1280, 720)
+        frames = load_frames(video_path, args.frames)
+    if not frames:
+        print(f"Error: Could not read frames from {video_path}")
+        return 1
+
+    variants = [("pytorch", False)]
+    for backend in args.backends.split(","):
+        if backend not in BACKENDS or backend == "pytorch":
+            print(f"Error: Unknown backend {backend}")
+            return 1
+        variants.append((backend, False))
+        if args.int8:
+            variants.append((backend, True))
+
+    results = {}
+    reference = None
+    failed = False
+    for backend, int8 in variants:
+        name = f"{backend}_int8" if int8 else backend
+        detector = YOLODetector(args.model, lazy=True, backend=backend, threads=args.threads, int8=int8,
+                                calibration_dir=args.calibration_dir)
+        detector.load_async(warmup=False).join()
+        if detector.load_error is not None:
+            print(f"{name:<16} skipped: {str(detector.load_error)}")
+            results[name] = {"error": str(detector.load_error)}
+            if reference is None:
+                return 1  # Nothing to compare against
+            continue
+        detector.confidence_threshold = args.confidence
+        outputs, result = run_backend(detector, frames, args.repeat, args.batch_size)
+        result["load_seconds"] = detector.load_time
+        if reference is None:
+            reference = outputs
+        else:
+            result["parity"] = parity(reference, outputs, args.match_iou)
+            # INT8 trades accuracy for speed, so only FP32 exports have to match
+            if not int8 and (result["parity"]["recall"] < args.min_recall
+                             or result["parity"]["precision"] < args.min_precision):
+                result["parity"]["failed"] = True
+                failed = True
+        results[name] = result
+
+        line = f"{name:<16} {result['fps']:8.1f} FPS  p50 {result['latency_per_frame']['p50_ms']:.1f} ms"
+        if "parity" in result:
+            check = result["parity"]
+            line += f"  recall {check['recall']:.3f}  precision {check['precision']:.3f}"
+            if check["mean_iou"] is not None:
+                line += f"  IoU {check['mean_iou']:.3f}  max conf diff {check['max_confidence_diff']:.3f}"
+            if check.get("failed"):
+                line += "  PARITY FAILED"
+        print(line)
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "model": args.model,
+        "source": args.video or f"synthetic 1280x720x{args.frames}",
+        "threads": args.threads,
+        "batch_size": args.batch_size,
+        "cpu_count": os.cpu_count(),
+        "peak_rss_mb": peak_rss_mb(),
+        "backends": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
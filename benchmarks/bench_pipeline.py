@@ -0,0 +1,256 @@
+"""
+Throughput/latency benchmarks for the detection pipeline.
+
+Runs offline on CPU-only Linux: without --model a StubModel stands in for
+YOLO, and without --video a synthetic clip is generated. Results are written
+as JSON so runs can be compared across commits and settings:
+
+    python benchmarks/bench_pipeline.py --output before.json
+    python benchmarks/bench_pipeline.py --output after.json --compare before.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from controller import YOLOController  # noqa: E402
+from detector import YOLODetector  # noqa: E402
+from utils import DisplaySurface, resize_for_display, save_video_writer  # noqa: E402
+from stub_model import StubModel  # noqa: E402
+
+
+def percentiles(samples):
+    """Summary of latency samples in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000.0
+    return {
+        "count": len(values),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def timed(samples, func):
+    """Wrap func so every call appends its duration to samples"""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+
+def make_synthetic_clip(path, frames, width, height, fps=30):
+    """Moving rectangles on a noisy background, so codecs and motion do real work"""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+    writer = save_video_writer(path, fps, width, height)
+    for i in range(frames):
+        frame = background.copy()
+        for k in range(5):
+            x = (i * (k + 3) * 4 + k * 150) % max(1, width - 120)
+            y = (k * 97 + i * 2) % max(1, height - 90)
+            cv2.rectangle(frame, (x, y), (x + 120, y + 90), (40 * k + 50, 200 - 30 * k, 120), -1)
+        writer.write(frame)
+    writer.release()
+
+
+def load_frames(video_path, limit):
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def bench_predict(detector, frames, repeat):
+    detect_samples, annotate_samples, total_samples = [], [], []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            frame = frame.copy()
+            t0 = time.perf_counter()
+            detections = detector.detect(frame)
+            t1 = time.perf_counter()
+            detector.annotate(frame, detections)
+            t2 = time.perf_counter()
+            detect_samples.append(t1 - t0)
+            annotate_samples.append(t2 - t1)
+            total_samples.append(t2 - t0)
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": len(total_samples),
+        "fps": len(total_samples) / elapsed if elapsed > 0 else 0.0,
+        "stages": {
+            "detect": percentiles(detect_samples),
+            "annotate": percentiles(annotate_samples),
+            "predict": percentiles(total_samples),
+        },
+    }
+
+
+def bench_controller(detector, video_path, batch_size, save_output):
+    read_samples, infer_samples, emit_samples = [], [], []
+    frames = [0]
+
+    def on_detections(detections):
+        frames[0] += 1
+
+    controller = YOLOController(detector, None, on_detections, batch_size=batch_size,
+                                video_pacing="fast", save_output=save_output)
+    # The pipeline is built from these attributes, so wrapping them times each stage
+    controller._read_frame = timed(read_samples, controller._read_frame)
+    controller._infer_batch = timed(infer_samples, controller._infer_batch)
+    controller._emit_frame = timed(emit_samples, controller._emit_frame)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        start = time.perf_counter()
+        controller.process_video(video_path, os.path.join(temp_dir, "bench_output.mp4"))
+        controller.wait()
+        elapsed = time.perf_counter() - start
+        controller.stop()
+
+    return {
+        "frames": frames[0],
+        "batch_size": batch_size,
+        "save_output": save_output,
+        "fps": frames[0] / elapsed if elapsed > 0 else 0.0,
+        "stages": {
+            "read": percentiles(read_samples),
+            "inference_batch": percentiles(infer_samples),
+            "output": percentiles(emit_samples),
+        },
+    }
+
+
+def bench_display(frames, repeat):
+    results = {}
+    surface = DisplaySurface(width=800, height=480)
+    for name, func in [
+        ("resize_for_display", lambda f: resize_for_display(cv2.cvtColor(f, cv2.COLOR_BGR2RGB))),
+        ("display_surface", surface.render),
+    ]:
+        samples = []
+        for _ in range(repeat):
+            for frame in frames:
+                t0 = time.perf_counter()
+                func(frame)
+                samples.append(time.perf_counter() - t0)
+        results[name] = percentiles(samples)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit')}):")
+    for name, result in current["benchmarks"].items():
+        old = baseline.get("benchmarks", {}).get(name)
+        if not old or "fps" not in result or not old.get("fps"):
+            continue
+        change = (result["fps"] / old["fps"] - 1.0) * 100.0
+        print(f"  {name:<28} {old['fps']:9.1f} -> {result['fps']:9.1f} FPS ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline")
+    parser.add_argument("--model", help="Real YOLO model to load instead of the offline stub")
+    parser.add_argument("--video", help="Recorded clip to use instead of a synthetic one")
+    parser.add_argument("--width", type=int, default=1280, help="Synthetic clip width")
+    parser.add_argument("--height", type=int, default=720, help="Synthetic clip height")
+    parser.add_argument("--frames", type=int, default=150, help="Synthetic clip length")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the frames for per-call benchmarks")
+    parser.add_argument("--batch-sizes", default="1,4", help="Comma separated controller batch sizes")
+    parser.add_argument("--output", default="bench_results.json", help="Where the JSON results are written")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    if args.model:
+        detector = YOLODetector(args.model)
+    else:
+        detector = YOLODetector(model=StubModel())
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video_path = args.video
+        if video_path is None:
+            video_path = os.path.join(temp_dir, "synthetic.mp4")
+            make_synthetic_clip(video_path, args.frames, args.width, args.height)
+        frames = load_frames(video_path, 60)
+        if not frames:
+            print(f"Error: Could not read frames from {video_path}")
+            return 1
+
+        batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+        benchmarks = {"predict": bench_predict(detector, frames, args.repeat)}
+        for batch_size in batch_sizes:
+            benchmarks[f"controller_batch{batch_size}"] = bench_controller(detector, video_path, batch_size, True)
+        # Analytics-only run: no writer, no display, so nothing is annotated
+        benchmarks["controller_no_output"] = bench_controller(detector, video_path, batch_sizes[-1], False)
+        benchmarks["display"] = bench_display(frames, args.repeat)
+
+    height, width = frames[0].shape[:2]
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "model": args.model or "stub",
+        "source": args.video or f"synthetic {args.width}x{args.height}x{args.frames}",
+        "resolution": f"{width}x{height}",
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "peak_rss_mb": peak_rss_mb(),
+        "benchmarks": benchmarks,
+    }
+
+    for name, result in benchmarks.items():
+        if "fps" in result:
+            print(f"{name:<28} {result['fps']:9.1f} FPS")
+    for name, stats in benchmarks["display"].items():
+        print(f"{name:<28} p50 {stats['p50_ms']:.2f} ms  p99 {stats['p99_ms']:.2f} ms")
+    print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Load generator for the HTTP inference service (cli.py serve).
+
+Opens --concurrency keep-alive connections that each POST JPEG frames to
+/detect as fast as answers come back, for --duration seconds, and reports
+throughput, latency percentiles, the status codes seen (503 means the
+server shed load) and the server's mean batch size. Without --url a server
+with a StubModel (or --model) is started in this process, so it runs
+entirely offline on localhost:
+
+    python benchmarks/load_server.py --concurrency 16 --max-batch-size 8
+    python benchmarks/load_server.py --url http://127.0.0.1:8080 --concurrency 32
+
+Clients and an in-process server share one interpreter; point --url at a
+separately started server for numbers that reflect the server alone.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from bench_pipeline import git_commit, load_frames, make_synthetic_clip, percentiles  # noqa: E402
+from detector import YOLODetector  # noqa: E402
+from server import InferenceServer  # noqa: E402
+from stub_model import StubModel  # noqa: E402
+
+
+async def request(reader, writer, method, path, body=b""):
+    """One HTTP/1.1 request on an open connection; returns (status, body)"""
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: image/jpeg\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(host, port, payloads, deadline, latencies, statuses, offset):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, "POST", "/detect", payloads[i % len(payloads)])
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            elif status == 503:
+                await asyncio.sleep(0.01)  # Back off briefly when the server sheds load
+            i += 1
+    finally:
+        writer.close()
+
+
+async def fetch(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return await request(reader, writer, "GET", path)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, payloads, concurrency, duration):
+    latencies = []
+    statuses = Counter()
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, payloads, start + duration, latencies, statuses, i)
+                           for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    _, metrics_text = await fetch(host, port, "/metrics")
+    return latencies, statuses, elapsed, metrics_text.decode()
+
+
+def counter_value(metrics_text, name):
+    """Value of one counter from the Prometheus text, or None"""
+    for line in metrics_text.splitlines():
+        if line.startswith(f"{name} ") or line.startswith(f"{name}{{"):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def start_local_server(args):
+    if args.model:
+        detector = YOLODetector(args.model)
+    else:
+        detector = YOLODetector(model=StubModel())
+    server = InferenceServer(detector, port=0, max_batch_size=args.max_batch_size,
+                             max_delay=args.max_delay_ms / 1000, max_queue=args.max_queue)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_until_complete, args=(server.serve(),), name="server")
+    thread.daemon = True
+    thread.start()
+    while server.ready is None or not server.ready.is_set():
+        time.sleep(0.01)
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the HTTP inference service")
+    parser.add_argument("--url", help="Running server to test (default: start one in this process)")
+    parser.add_argument("--model", help="YOLO model for the local server (default: StubModel)")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Local server batch size")
+    parser.add_argument("--max-delay-ms", type=float, default=10.0, help="Local server batch delay")
+    parser.add_argument("--max-queue", type=int, default=64, help="Local server queue limit")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load")
+    parser.add_argument("--video", help="Clip whose frames are sent instead of synthetic ones")
+    parser.add_argument("--frames", type=int, default=30, help="Distinct frames sent")
+    parser.add_argument("--width", type=int, default=640, help="Synthetic frame width")
+    parser.add_argument("--height", type=int, default=480, help="Synthetic frame height")
+    parser.add_argument("--output", default="bench_results_server.json", help="Where the JSON results are written")
+    args = parser.parse_args(argv)
+
+    if args.video:
+        frames = load_frames(args.video, args.frames)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            video_path = os.path.join(temp_dir, "synthetic.mp4")
+            make_synthetic_clip(video_path, args.frames, args.width, args.height)
+            frames = load_frames(video_path, args.frames)
+    if not frames:
+        print("Error: Could not read frames to send")
+        return 1
+    payloads = [cv2.imencode(".jpg", frame)[1].tobytes() for frame in frames]
+
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        server = start_local_server(args)
+        host, port = server.host, server.port
+
+    latencies, statuses, elapsed, metrics_text = asyncio.run(
+        run_load(host, port, payloads, args.concurrency, args.duration))
+    batches = counter_value(metrics_text, "waste_batches_total")
+    batched_frames = counter_value(metrics_text, "waste_batched_frames_total")
+    result = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "server": args.url or f"local, max batch {args.max_batch_size}, delay {args.max_delay_ms} ms",
+        "concurrency": args.concurrency,
+        "duration": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency": percentiles(latencies),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "mean_batch_size": batched_frames / batches if batches else None,
+        "cpu_count": os.cpu_count(),
+    }
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    latency = result["latency"]
+    print(f"{result['requests_per_second']:.1f} req/s over {elapsed:.1f} s with {args.concurrency} clients")
+    if latency["count"]:
+        print(f"latency p50 {latency['p50_ms']:.1f} ms  p95 {latency['p95_ms']:.1f} ms  "
+              f"p99 {latency['p99_ms']:.1f} ms")
+    print("statuses: " + ", ".join(f"{status}: {count}" for status, count in result["statuses"].items()))
+    if result["mean_batch_size"] is not None:
+        print(f"mean batch size {result['mean_batch_size']:.2f}")
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
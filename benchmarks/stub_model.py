@@ -0,0 +1,65 @@
+import numpy as np
+import cv2
+
+# Class names of the waste model described in the README
+WASTE_CLASSES = [
+    "Aluminium foil", "Bottle cap", "Bottle", "Broken glass", "Can", "Carton", "Cigarette",
+    "Cup", "Lid", "Other litter", "Other plastic", "Paper", "Plastic bag - wrapper",
+    "Plastic container", "Pop tab", "Straw", "Styrofoam piece", "Unlabeled litter",
+]
+
+
+class _Boxes:
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class _Result:
+    def __init__(self, data, names):
+        self.boxes = _Boxes(data)
+        self.names = names
+
+    def __len__(self):
+        return len(self.boxes)
+
+
+class StubModel:
+    """
+    Offline stand-in for an ultralytics YOLO model.
+
+    Called like YOLO: model(frame_or_list, conf=...) returns one result per
+    frame with boxes.data as an (N, 6) x1, y1, x2, y2, confidence, class_id
+    array. To cost roughly what a small model's preprocessing does, every
+    frame is letterboxed to imgsz and normalised to float32. Detections are
+    derived deterministically from the frame so repeated runs are comparable.
+    """
+
+    def __init__(self, imgsz=640, boxes_per_frame=8, names=None, seed=0):
+        self.imgsz = imgsz
+        self.boxes_per_frame = boxes_per_frame
+        self.names = dict(enumerate(names or WASTE_CLASSES))
+        self._rng = np.random.default_rng(seed)
+        # Unit boxes and scores reused for every frame, scaled per frame size
+        self._unit_boxes = np.sort(self._rng.random((boxes_per_frame, 2, 2)), axis=1).reshape(-1, 4)
+        self._scores = self._rng.uniform(0.2, 0.99, boxes_per_frame).astype(np.float32)
+        self._classes = self._rng.integers(0, len(self.names), boxes_per_frame).astype(np.float32)
+
+    def __call__(self, source, conf=0.25, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        results = []
+        for frame in frames:
+            h, w = frame.shape[:2]
+            scale = self.imgsz / max(h, w)
+            resized = cv2.resize(frame, (int(w * scale), int(h * scale)))
+            tensor = resized.astype(np.float32) / 255.0
+            # Brightness nudges the scores so different frames give different results
+            shift = float(tensor.mean()) * 0.1
+
+            boxes = self._unit_boxes * np.array([w, h, w, h], dtype=np.float32)
+            scores = np.clip(self._scores + shift, 0.0, 1.0)
+            data = np.column_stack([boxes, scores, self._classes]).astype(np.float32)
+            results.append(_Result(data[scores >= conf], self.names))
+        return results
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from regions import merge_boxes  # noqa: E402
+
+PARTIAL = [100, 100, 200, 300]  # Object cut by a tile edge
+WHOLE = [100, 100, 400, 300]  # Same object seen whole by the full-region window
+
+
+def kept_boxes(boxes, confidences, class_ids=None, window_ids=None, threshold=0.6):
+    boxes = np.array(boxes, dtype=np.float32)
+    class_ids = np.zeros(len(boxes), dtype=np.int64) if class_ids is None else np.array(class_ids)
+    window_ids = np.arange(len(boxes)) if window_ids is None else np.array(window_ids)
+    keep = merge_boxes(boxes, np.array(confidences), class_ids, window_ids, threshold)
+    return boxes[keep].tolist()
+
+
+def test_whole_box_kept_when_it_scores_higher():
+    assert kept_boxes([PARTIAL, WHOLE], [0.8, 0.9]) == [WHOLE]
+
+
+def test_whole_box_kept_when_partial_box_scores_higher():
+    assert kept_boxes([PARTIAL, WHOLE], [0.9, 0.8]) == [WHOLE]
+
+
+def test_boxes_from_the_same_window_are_kept():
+    assert len(kept_boxes([PARTIAL, WHOLE], [0.9, 0.8], window_ids=[0, 0])) == 2
+
+
+def test_boxes_of_different_classes_are_kept():
+    assert len(kept_boxes([PARTIAL, WHOLE], [0.9, 0.8], class_ids=[0, 1])) == 2
+
+
+def test_separate_objects_are_kept():
+    assert len(kept_boxes([[0, 0, 50, 50], [100, 100, 150, 150]], [0.9, 0.8])) == 2